@@ -1,22 +1,66 @@
 # app.py  —  FlexiLogis • Kardex + Stats (Flask + SQLite + Chart.js)
 # Python 3.12 x64 recommandé
 
-from datetime import date, datetime
+from array import array
+import bisect
+import calendar
+from collections.abc import Callable
+from datetime import date, datetime, time, timedelta, timezone
 from dateutil.relativedelta import relativedelta
-from io import StringIO
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+from functools import wraps
+from io import BytesIO, StringIO, TextIOWrapper
 import csv
+import gzip
+import hashlib
 import json
 import math
+import mimetypes
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+from time import monotonic
+import unicodedata
+import zipfile
+from urllib.parse import quote
 
-from flask import Flask, request, redirect, url_for, render_template, make_response
+import click
+from flask import Flask, Response, request, redirect, url_for, render_template, make_response, abort, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_, text
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.security import safe_join
+from sqlalchemy import bindparam, case, create_engine, event, func, insert, inspect, or_, text
+from sqlalchemy.orm import column_property, contains_eager, sessionmaker
 from sqlalchemy.exc import OperationalError
 
+try:
+    import brotli  # optionnel : variantes .br des fichiers statiques
+except ImportError:
+    brotli = None
+try:
+    import numpy as np  # optionnel : calculs vectorisés sur l'instantané des résidents
+except ImportError:
+    np = None
+try:
+    import pyarrow as pa  # optionnel : export analytique au format Parquet
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///flexilogis.db"
+# Variables d'environnement : base et configuration alternatives (tests de charge, autres sites)
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("FLEXILOGIS_DATABASE_URI", "sqlite:///flexilogis.db")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db = SQLAlchemy(app)
+# Templates compilés conservés d'un démarrage à l'autre
+os.makedirs(os.path.join(app.instance_path, "jinja-cache"), exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.path.join(app.instance_path, "jinja-cache"))
 
 # ============================
 # Modèles
@@ -36,13 +80,96 @@ class Family(db.Model):
 
 class Person(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    family_id = db.Column(db.Integer, db.ForeignKey("family.id"), index=True, nullable=False)
+    # Ancienne valeur chargée avant modification : les alertes de l'ancienne famille sont réévaluées
+    family_id = column_property(db.Column(db.Integer, db.ForeignKey("family.id"), index=True, nullable=False), active_history=True)
     first_name = db.Column(db.String(80), index=True, nullable=False)
     last_name  = db.Column(db.String(80), index=True, nullable=False)
     dob = db.Column(db.Date, index=True)
     sex = db.Column(db.String(12), index=True)            # "F","M","Autre/NP"
     phone = db.Column(db.String(20), index=True)
 
+class ArchivedFamily(db.Model):
+    """Famille partie depuis longtemps, déplacée dans la base d'archives attachée."""
+    __tablename__ = "family"
+    __table_args__ = {"schema": "archive"}
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    label = db.Column(db.String(120), index=True)
+    room_number = db.Column(db.String(20), index=True)
+    room_number2 = db.Column(db.String(20), index=True)
+    arrival_date = db.Column(db.Date, index=True)
+    departure_date = db.Column(db.Date, index=True)
+    phone1 = db.Column(db.String(20), index=True)
+    phone2 = db.Column(db.String(20), index=True)
+
+    persons = db.relationship("ArchivedPerson", backref="family", cascade="all,delete", lazy="dynamic")
+
+class ArchivedPerson(db.Model):
+    __tablename__ = "person"
+    __table_args__ = {"schema": "archive"}
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    family_id = db.Column(db.Integer, db.ForeignKey("archive.family.id"), index=True, nullable=False)
+    first_name = db.Column(db.String(80), index=True, nullable=False)
+    last_name  = db.Column(db.String(80), index=True, nullable=False)
+    dob = db.Column(db.Date, index=True)
+    sex = db.Column(db.String(12), index=True)
+    phone = db.Column(db.String(20), index=True)
+
+class AppState(db.Model):
+    """Petites valeurs persistantes (ex: date du dernier passage des tâches quotidiennes)."""
+    key = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.String(200))
+
+class StatCounter(db.Model):
+    """Agrégats des personnes présentes (sexe, tranches d'âge, adultes/enfants)."""
+    key = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class DuplicateDismissal(db.Model):
+    """Paire de personnes jugées distinctes lors de la revue des doublons (person_a < person_b)."""
+    person_a = db.Column(db.Integer, primary_key=True)
+    person_b = db.Column(db.Integer, primary_key=True)
+
+class ChangeLog(db.Model):
+    """Journal des modifications de family/person, alimenté par des triggers SQLite."""
+    __table_args__ = {"sqlite_autoincrement": True}   # numéros jamais réutilisés, même après compactage
+    seq = db.Column(db.Integer, primary_key=True)
+    at = db.Column(db.DateTime, nullable=False)
+    table_name = db.Column(db.String(20), nullable=False)
+    op = db.Column(db.String(10), nullable=False)       # insert, update, delete, archive
+    row_id = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text)                           # JSON : la ligne après modification
+    movement = db.Column(db.String(10))                 # familles : arrival, departure, return
+
+class BackupPending(db.Model):
+    """Lignes modifiées depuis la dernière sauvegarde incrémentale (alimentée par des triggers)."""
+    table_name = db.Column(db.String(20), primary_key=True)
+    row_id = db.Column(db.Integer, primary_key=True)
+
+class Alert(db.Model):
+    """Alerte calculée pour une famille présente (voir ALERT_RULES)."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), index=True, nullable=False)
+    family_id = db.Column(db.Integer, index=True, nullable=False)
+    person_id = db.Column(db.Integer, index=True)
+    room = db.Column(db.String(20))
+    data = db.Column(db.Text)
+
+class AlertState(db.Model):
+    """Version de la famille (family_version) pour laquelle ses alertes ont été calculées."""
+    family_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class FamilyVersion(db.Model):
+    """Version par famille (famille ou membres modifiés), incrémentée par des triggers SQLite."""
+    family_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    """Compteur de modifications (une seule ligne), incrémenté par des triggers SQLite."""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
 # ============================
 # Helpers
 # ============================
@@ -67,7 +194,7 @@ AGE_COLORS_M = ['#128193', '#19a078', '#208537', '#cc9a05', '#ca6410', '#b02a37'
 SEX_CHOICES = ["F", "M", "Autre/NP"]
 
 # ----- Configuration -----
-CONFIG_FILE = "config.json"
+CONFIG_FILE = os.environ.get("FLEXILOGIS_CONFIG", "config.json")
 DEFAULT_CONFIG = {
     "hotel": {
         "total_rooms": "",
@@ -113,6 +240,9 @@ DEFAULT_CONFIG = {
     "layout": {
         "floors": [],
     },
+    "archive": {
+        "after_days": 90,  # les familles parties depuis plus longtemps passent en archive
+    },
 }
 
 
@@ -231,6 +361,122 @@ def extract_room_layout(stage_data, cell_w=80, cell_h=40) -> tuple[list[dict], i
     return rooms, width, height
 
 
+# ----- Plans d'étage (stockage par empreinte) -----
+
+# config.json ne référence que l'empreinte de chaque plan : {"name", "layout"}.
+# Le contenu est rangé dans layouts/ à côté de config.json, en deux fichiers :
+# <empreinte>.json (scène Konva, lue par l'éditeur) et <empreinte>.rooms.json
+# (chambres extraites, lues par le plan du dashboard). L'empreinte couvre la
+# scène et la taille des cellules : un étage inchangé n'est jamais ré-extrait.
+_floor_cache: dict[str, dict] = {}
+
+
+def layout_dir() -> str:
+    return os.path.join(os.path.dirname(CONFIG_FILE) or ".", "layouts")
+
+
+def _write_json(path: str, data) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def store_floor(stage_data, cell_w: int, cell_h: int) -> str:
+    """Range un plan d'étage et retourne son empreinte (extraction seulement s'il est nouveau)."""
+    payload = json.dumps([stage_data, cell_w, cell_h], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+    base = os.path.join(layout_dir(), digest)
+    if not os.path.exists(f"{base}.rooms.json"):
+        os.makedirs(layout_dir(), exist_ok=True)
+        rooms, width, height = extract_room_layout(stage_data, cell_w, cell_h)
+        _write_json(f"{base}.json", stage_data)
+        _write_json(f"{base}.rooms.json", {"rooms": rooms, "width": width, "height": height})
+    return digest
+
+
+def _read_floor_file(digest: str, suffix: str):
+    key = f"{digest}{suffix}"
+    if key not in _floor_cache:
+        # Contenu immuable (adressé par empreinte) : gardé en mémoire sans invalidation.
+        # Un échec de lecture n'est pas mémorisé (fichier pas encore écrit, copie en cours…).
+        try:
+            with open(os.path.join(layout_dir(), key), "r", encoding="utf-8") as f:
+                _floor_cache[key] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    return _floor_cache[key]
+
+
+def floor_layouts(cfg: dict, with_data: bool = False) -> list[dict]:
+    """Étages du plan : {name, rooms, width, height} (+ data pour l'éditeur)."""
+    floors = []
+    for floor in cfg.get("layout", {}).get("floors") or []:
+        digest = floor.get("layout")
+        if digest is None:
+            # Ancien format : plan complet directement dans config.json
+            floors.append(floor)
+            continue
+        info = _read_floor_file(digest, ".rooms.json") or {"rooms": [], "width": 0, "height": 0}
+        item = {"name": floor.get("name", ""), **info}
+        if with_data:
+            item["data"] = _read_floor_file(digest, ".json")
+        floors.append(item)
+    return floors
+
+
+def externalize_floors(cfg: dict) -> bool:
+    """Remplace les plans écrits dans la config par des références ; retourne True si modifiée."""
+    layout = cfg.get("layout", {})
+    changed = False
+    for floor in layout.get("floors") or []:
+        if "layout" not in floor:
+            floor["layout"] = store_floor(
+                floor.get("data"), int(layout.get("cell_width") or 80), int(layout.get("cell_height") or 40)
+            )
+            for k in ("data", "rooms", "width", "height"):
+                floor.pop(k, None)
+            changed = True
+    return changed
+
+
+def migrate_floor_layouts() -> bool:
+    """Sort de config.json les plans d'étage encore écrits en entier (ancien format).
+
+    Lancée une fois via ``flask migrate-layouts`` ; en attendant, floor_layouts
+    lit aussi l'ancien format. Retourne True si la configuration a été réécrite.
+    """
+    cfg = load_config()
+    if externalize_floors(cfg):
+        save_config(cfg)
+        return True
+    return False
+
+
+@app.cli.command("migrate-layouts")
+def migrate_layouts_command():
+    """Range les plans d'étage de config.json dans layouts/ (ancien format)."""
+    print("Plans d'étage migrés" if migrate_floor_layouts() else "Aucun plan à migrer")
+
+
+def floor_digests(cfg: dict) -> set[str]:
+    return {f["layout"] for f in cfg.get("layout", {}).get("floors") or [] if f.get("layout")}
+
+
+def prune_floors(previous: set[str], cfg: dict) -> None:
+    """Supprime les plans que la configuration référençait avant l'enregistrement et plus après.
+
+    Les autres fichiers du dossier (d'autres sites peuvent le partager) ne sont pas touchés.
+    """
+    for digest in previous - floor_digests(cfg):
+        for suffix in (".json", ".rooms.json"):
+            try:
+                os.remove(os.path.join(layout_dir(), f"{digest}{suffix}"))
+            except FileNotFoundError:
+                pass
+            _floor_cache.pop(f"{digest}{suffix}", None)
+
+
 def room_capacity(room: str, cfg: dict) -> int:
     occup = cfg.get("occupation", {})
     per_room = occup.get("per_room", {})
@@ -310,6 +556,47 @@ def phones_text(f: "Family") -> str:
     return " / ".join(p for p in [clean_field(f.phone1), clean_field(f.phone2)] if p)
 
 
+# ----- Projections pour les listes -----
+
+# Les listes lisent seulement les colonnes affichées (famille jointe en SQL)
+# dans des enregistrements légers, sans entités ORM ni chargements paresseux.
+
+def person_columns(P, F) -> tuple:
+    return (
+        P.id, P.first_name, P.last_name, P.dob, P.sex, P.phone,
+        F.id, F.label, F.room_number, F.room_number2, F.arrival_date,
+    )
+
+
+def family_columns(F) -> tuple:
+    return (F.id, F.label, F.room_number, F.room_number2, F.arrival_date, F.departure_date, F.phone1, F.phone2)
+
+
+class PersonRow:
+    """Personne avec les informations de sa famille (voir person_columns)."""
+    __slots__ = (
+        "id", "first_name", "last_name", "dob", "sex", "phone", "family_id", "family_label",
+        "room_number", "arrival_date", "age", "age_text", "age_days",
+    )
+
+    def __init__(self, row, today: date):
+        (self.id, self.first_name, self.last_name, self.dob, self.sex, self.phone,
+         self.family_id, self.family_label, room1, room2, self.arrival_date) = row
+        self.room_number = " & ".join(r for r in (clean_field(room1), clean_field(room2)) if r)
+        self.age = age_years(self.dob, today)
+        self.age_text = age_text(self.dob, today)
+        self.age_days = age_days(self.dob, today)
+
+
+class FamilyRow:
+    """Colonnes d'une famille (voir family_columns) ; compatible avec rooms_text/phones_text."""
+    __slots__ = ("id", "label", "room_number", "room_number2", "arrival_date", "departure_date", "phone1", "phone2")
+
+    def __init__(self, row):
+        (self.id, self.label, self.room_number, self.room_number2,
+         self.arrival_date, self.departure_date, self.phone1, self.phone2) = row
+
+
 def age_color(p: "Person", age: int | None = None) -> str:
     a = age if age is not None else age_years(p.dob)
     if a is None:
@@ -334,6 +621,204 @@ def inject_globals():
         "age_color": age_color,
     }
 
+# ----- Cache HTTP (ETag) -----
+
+def deploy_version() -> str:
+    """Version du déploiement : FLEXILOGIS_VERSION, sinon empreinte du code, des
+    templates et des fichiers statiques.
+
+    Identique pour tous les processus d'un même déploiement : un ETag émis par
+    l'un est reconnu par les autres, et une nouvelle version du code l'invalide.
+    """
+    digest = hashlib.sha1()
+    files = [os.path.join(app.root_path, "app.py")]
+    for folder in (os.path.join(app.root_path, app.template_folder), app.static_folder):
+        for root, dirs, names in os.walk(folder):
+            dirs.sort()
+            files += [os.path.join(root, n) for n in sorted(names) if not n.endswith((".gz", ".br"))]
+    for path in files:
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            continue
+    return os.environ.get("FLEXILOGIS_VERSION") or digest.hexdigest()[:12]
+
+
+DEPLOY_VERSION = deploy_version()
+
+
+def data_version() -> tuple[int, datetime | None]:
+    """Retourne ``(version, updated_at)`` du compteur de modifications."""
+    row = db.session.execute(text("SELECT version, updated_at FROM data_version WHERE id = 1")).first()
+    if row is None:
+        return 0, None
+    updated = row[1]
+    if isinstance(updated, str):
+        updated = datetime.fromisoformat(updated)
+    return row[0], updated
+
+
+def data_version_triggers(schema: str) -> list[str]:
+    """Triggers qui incrémentent data_version à chaque écriture sur family/person.
+
+    Base d'archives : triggers TEMP, créés pour chaque connexion (configure_connection).
+    """
+    statements = []
+    for table in ("family", "person"):
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            if schema == "main":
+                head = f"CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_version AFTER {op} ON {table} "
+            else:
+                head = f"CREATE TEMP TRIGGER IF NOT EXISTS archived_{table}_{op.lower()}_version AFTER {op} ON {schema}.{table} "
+            statements.append(
+                head + "BEGIN UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1; END"
+            )
+    return statements
+
+
+def config_version() -> str:
+    try:
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return "0"
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def current_etag() -> str:
+    """ETag calculé à partir des données, de la config, de la date et du déploiement.
+
+    Le thème (cookie) change le rendu HTML, il fait donc partie de l'ETag.
+    """
+    key = (
+        f"{data_version()[0]}:{config_version()}:{date.today().isoformat()}:"
+        f"{request.cookies.get('theme', 'dark')}:{DEPLOY_VERSION}"
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def conditional(view):
+    """Répond 304 sans exécuter la vue si le client possède déjà la version courante.
+
+    Seul l'ETag (compteur de versions) sert à la validation : pas de
+    Last-Modified, dont la précision à la seconde laisserait passer deux
+    écritures de la même seconde.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = current_etag()
+        if request.if_none_match.contains_weak(etag):
+            resp = make_response("", 304)
+        else:
+            resp = make_response(view(*args, **kwargs))
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return wrapper
+
+# ----- Fichiers statiques (empreinte + précompression) -----
+
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".json", ".svg", ".ico", ".html", ".txt")
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+_static_hashes: dict[str, tuple[int, str]] = {}
+
+
+def static_hash(filename: str) -> str | None:
+    """Empreinte (contenu) d'un fichier statique, mise en cache selon son mtime."""
+    path = safe_join(app.static_folder, filename)
+    if path is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _static_hashes[filename] = (mtime, digest)
+    return digest
+
+
+def build_static_assets() -> int:
+    """Génère les variantes .gz (et .br si brotli est installé) des fichiers texte.
+
+    Appelée au déploiement par ``flask build-static``, jamais à l'import : tant
+    qu'une variante manque ou est périmée, le fichier source est servi tel quel.
+    Seuls les fichiers absents ou plus anciens que la source sont régénérés.
+    Retourne le nombre de fichiers écrits.
+    """
+    written = 0
+    for root, _dirs, files in os.walk(app.static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            src = os.path.join(root, name)
+            mtime = os.stat(src).st_mtime_ns
+            with open(src, "rb") as f:
+                raw = f.read()
+            variants = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append((".br", lambda data: brotli.compress(data, quality=11)))
+            for ext, compress in variants:
+                dst = src + ext
+                try:
+                    if os.stat(dst).st_mtime_ns >= mtime:
+                        continue
+                except OSError:
+                    pass
+                with open(dst, "wb") as f:
+                    f.write(compress(raw))
+                written += 1
+    return written
+
+
+@app.url_defaults
+def static_fingerprint(endpoint, values):
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = static_hash(values["filename"])
+        if digest:
+            values["v"] = digest
+
+
+def static_files(filename):
+    """Sert un fichier statique, en variante précompressée si le client l'accepte.
+
+    Les URLs portant la bonne empreinte (``?v=``) sont mises en cache un an.
+    """
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    resp = None
+    path = safe_join(app.static_folder, filename)
+    if path and filename.endswith(COMPRESSIBLE_EXTENSIONS):
+        for encoding, ext in PRECOMPRESSED:
+            if not request.accept_encodings[encoding]:
+                continue
+            try:
+                fresh = os.stat(path + ext).st_mtime_ns >= os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if fresh:
+                resp = send_from_directory(app.static_folder, filename + ext, mimetype=mimetype)
+                resp.headers["Content-Encoding"] = encoding
+                break
+    if resp is None:
+        resp = send_from_directory(app.static_folder, filename, mimetype=mimetype)
+    resp.vary.add("Accept-Encoding")
+    if request.args.get("v") and request.args.get("v") == static_hash(filename):
+        resp.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+    return resp
+
+
+app.view_functions["static"] = static_files
+
+
+@app.cli.command("build-static")
+def build_static_command():
+    """Précompresse les fichiers statiques (gzip, brotli si disponible)."""
+    print(f"{build_static_assets()} fichier(s) généré(s)")
+
 @app.route("/theme/<mode>")
 def set_theme(mode):
     if mode not in ("light", "dark"):
@@ -342,295 +827,1576 @@ def set_theme(mode):
     resp.set_cookie("theme", mode, max_age=60 * 60 * 24 * 365)
     return resp
 
-# ============================
-# Routes
-# ============================
+@app.errorhandler(OperationalError)
+def database_locked(e):
+    """Base verrouillée par un autre écrivain : 503 plutôt qu'une erreur 500."""
+    db.session.rollback()
+    if "database is locked" not in str(e.orig):
+        raise e
+    return "Base de données occupée (database is locked), réessayez.", 503, {"Retry-After": "1"}
 
-@app.route("/")
-def dashboard():
-    cfg = load_config()
-    alerts_cfg = cfg.get("alerts", {})
-    dashboard_cfg = cfg.get("dashboard", {})
-    baby_age = alerts_cfg.get("baby_age", 1)
-    show_free_rooms = alerts_cfg.get("show_free_rooms", True)
-    show_overcrowded = alerts_cfg.get("show_overcrowded", True)
-    show_isolated_women = alerts_cfg.get("show_isolated_women", True)
-    show_baby_alert = alerts_cfg.get("show_baby_alert", True)
-    show_alert_box = dashboard_cfg.get("show_alerts", True)
-    show_total_clients = dashboard_cfg.get("show_total_clients", True)
-    show_birthdays = dashboard_cfg.get("show_birthdays", True)
-    show_tenures = dashboard_cfg.get("show_tenures", True)
-    show_age_groups = dashboard_cfg.get("show_age_groups", True)
-    show_room_layout = dashboard_cfg.get("show_room_layout", True)
-    show_recent_families = dashboard_cfg.get("show_recent_families", True)
-    sex_chart_diameter = dashboard_cfg.get("sex_chart_diameter", 200)
-    box_layout = dashboard_cfg.get("layout", {})
-    today = date.today()
-    persons = Person.query.join(Family).filter(Family.departure_date.is_(None)).all()
+# ----- Tâches quotidiennes -----
 
-    # Répartition sexes
-    sex_counts = {k: 0 for k in SEX_CHOICES}
-    # Tranches d'âge par sexe
-    age_counts = {b[0]: {"F": 0, "M": 0} for b in AGE_BUCKETS}
-    # Comptages adultes/enfants détaillés
-    adult_female_count = adult_male_count = 0
-    girl_count = boy_count = 0
+# Archivage, recalcul des alertes, compactage du journal, sauvegarde
+# incrémentale... : lancées hors des requêtes, par une tâche planifiée
+# (cron, timer systemd) qui appelle ``flask --app app daily-jobs`` chaque nuit.
+# Une seule exécution par jour, tous processus et serveurs confondus.
+DAILY_JOBS: list = []
 
-    for p in persons:
-        s = p.sex if p.sex in sex_counts else "Autre/NP"
-        sex_counts[s] += 1
-        a = age_years(p.dob, today)
-        p._age = a
-        b = bucket_for_age(a)
-        if b and s in ("F", "M"):
-            age_counts[b][s] += 1
-        if a is not None and s in ("F", "M"):
-            if a < 18:
-                if s == "F":
-                    girl_count += 1
-                else:
-                    boy_count += 1
-            else:
-                if s == "F":
-                    adult_female_count += 1
-                else:
-                    adult_male_count += 1
 
-    # Listes des 5 adultes/enfants les plus âgés et les plus jeunes
-    adults = [p for p in persons if p._age is not None and p._age >= 18]
-    children = [p for p in persons if p._age is not None and p._age < 18]
-    oldest_adults = sorted(adults, key=lambda p: p._age, reverse=True)[:5]
-    youngest_adults = sorted(adults, key=lambda p: p._age)[:5]
-    oldest_children = sorted(children, key=lambda p: p._age, reverse=True)[:5]
-    youngest_children = sorted(children, key=lambda p: p._age)[:5]
+def daily_job(fn):
+    DAILY_JOBS.append(fn)
+    return fn
 
-    # Anniversaires (semaine/mois passés et à venir)
-    birthdays_today: list[dict] = []
-    birthdays_week_ahead: list[dict] = []
-    birthdays_week_past: list[dict] = []
-    birthdays_month_ahead: list[dict] = []
-    birthdays_month_past: list[dict] = []
 
-    week_ahead_end = today + relativedelta(weeks=1)
-    month_ahead_end = today + relativedelta(months=1)
-    week_past_start = today - relativedelta(weeks=1)
-    month_past_start = today - relativedelta(months=1)
+def run_daily_jobs(today: date | None = None, force: bool = False) -> bool:
+    today = today or date.today()
+    claimed = db.session.execute(
+        text("UPDATE app_state SET value = :today WHERE key = 'daily_jobs' AND value < :today"),
+        {"today": today.isoformat()},
+    ).rowcount
+    db.session.commit()
+    if not claimed and not force:
+        return False
+    for job in DAILY_JOBS:
+        try:
+            job(today)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Tâche quotidienne en échec : %s", job.__name__)
+    return True
 
-    for p in persons:
-        if not p.dob:
-            continue
-        dob_this_year = p.dob.replace(year=today.year)
-        if dob_this_year == today:
-            birthdays_today.append({
-                "person": p,
-                "age": age_years(p.dob, today),
-            })
-            continue
 
-        next_bd = dob_this_year if dob_this_year > today else dob_this_year.replace(year=today.year + 1)
-        prev_bd = dob_this_year if dob_this_year < today else dob_this_year.replace(year=today.year - 1)
+@app.cli.command("daily-jobs")
+@click.option("--force", is_flag=True, help="Relance les tâches même si elles ont déjà tourné aujourd'hui.")
+def daily_jobs_command(force):
+    """Exécute les tâches quotidiennes (à planifier une fois par jour)."""
+    if run_daily_jobs(force=force):
+        print("Tâches quotidiennes exécutées")
+    else:
+        print("Tâches quotidiennes déjà exécutées aujourd'hui (--force pour relancer)")
 
-        if today < next_bd <= week_ahead_end:
-            birthdays_week_ahead.append({
-                "person": p,
-                "date": next_bd,
-                "age": age_years(p.dob, next_bd),
-            })
-        elif today < next_bd <= month_ahead_end:
-            birthdays_month_ahead.append({
-                "person": p,
-                "date": next_bd,
-                "age": age_years(p.dob, next_bd),
-            })
+# ----- Archives -----
 
-        if week_past_start <= prev_bd < today:
-            birthdays_week_past.append({
-                "person": p,
-                "date": prev_bd,
-                "age": age_years(p.dob, prev_bd),
-            })
-        elif month_past_start <= prev_bd < today:
-            birthdays_month_past.append({
-                "person": p,
-                "date": prev_bd,
-                "age": age_years(p.dob, prev_bd),
-            })
+# Niveaux de stockage : (famille, personne). Les familles parties depuis plus
+# de ``archive.after_days`` jours sont déplacées dans la base d'archives,
+# attachée à chaque connexion sous le schéma ``archive``.
+ARCHIVE_TIERS = ((Family, Person), (ArchivedFamily, ArchivedPerson))
+FAMILY_COLUMNS = [c.name for c in Family.__table__.columns]
+PERSON_COLUMNS = [c.name for c in Person.__table__.columns]
 
-    birthdays_week_ahead.sort(key=lambda b: b["date"])
-    birthdays_month_ahead.sort(key=lambda b: b["date"])
-    birthdays_week_past.sort(key=lambda b: b["date"], reverse=True)
-    birthdays_month_past.sort(key=lambda b: b["date"], reverse=True)
 
-    # Familles récentes et ancienneté
-    families = Family.query.filter(Family.departure_date.is_(None)).order_by(
-        Family.arrival_date.desc().nullslast(), Family.id.desc()
-    ).all()
-    recent_families = families[:5]
-    old_families = (
-        Family.query.filter(Family.departure_date.is_(None))
-        .order_by(Family.arrival_date.asc().nullslast(), Family.id.asc())
-        .limit(5)
-        .all()
-    )
+def archive_db_path(main_path: str | None) -> str:
+    if not main_path or main_path == ":memory:":
+        return ":memory:"
+    root, ext = os.path.splitext(main_path)
+    return f"{root}_archive{ext or '.db'}"
 
-    def days_since(arrival: date | None) -> int:
-        return (today - arrival).days if arrival else 0
 
-    def tenure_text(arrival: date | None) -> str:
-        if not arrival:
-            return "(0 jour)"
-        rd = relativedelta(today, arrival)
-        return f"({rd.years} ans et {rd.months} mois et {rd.days} jours)"
+def configure_connection(dbapi_conn, _record):
+    """Attache la base d'archives et passe les deux fichiers en mode WAL.
 
-    old_labels = [f.label or f"Famille {f.id}" for f in old_families]
-    old_values = [days_since(f.arrival_date) for f in old_families]
-    old_tenures = [tenure_text(f.arrival_date) for f in old_families]
-    recent_labels = [f.label or f"Famille {f.id}" for f in recent_families]
-    recent_values = [days_since(f.arrival_date) for f in recent_families]
-    recent_tenures = [tenure_text(f.arrival_date) for f in recent_families]
+    En WAL, les lectures (rapports, exports) ne bloquent pas les écritures.
+    """
+    dbapi_conn.execute("ATTACH DATABASE ? AS archive", (archive_db_path(db.engine.url.database),))
+    for schema in ("main", "archive"):
+        try:
+            dbapi_conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        except sqlite3.OperationalError:
+            pass
+    # Triggers sur la base attachée : seuls les triggers TEMP (propres à la connexion) le permettent
+    for statement in backup_pending_triggers("archive") + data_version_triggers("archive"):
+        try:
+            dbapi_conn.execute(statement)
+        except sqlite3.OperationalError:
+            pass   # tables pas encore créées (premier démarrage)
 
-    # Chambres libres
-    all_rooms = set(generate_rooms(cfg))
-    occupied_rooms: set[str] = set()
-    for f in families:
-        for r in (f.room_number, f.room_number2):
-            r = clean_field(r)
-            if r:
-                occupied_rooms.add(r)
-    free_rooms = sorted(
-        all_rooms - occupied_rooms,
-        key=lambda x: int(x) if x.isdigit() else x,
-    )
 
-    room_data = {r: {"occupied": False, "family": None, "family_id": None} for r in all_rooms}
-    for f in families:
-        fam_label = f.label if f.label not in [None, "None"] else f"Famille {f.id}"
-        for r in (f.room_number, f.room_number2):
-            r = clean_field(r)
-            if r:
-                room_data[r] = {"occupied": True, "family": fam_label, "family_id": f.id}
+def allocate_ids(session, table: str, count: int) -> int:
+    """Réserve ``count`` ids jamais utilisés (archives comprises) ; retourne le premier.
 
-    # Alertes : sur-occupation, femmes isolées, bébés selon config
-    overcrowded_rooms: list[dict] = []
-    isolated_women: list[Person] = []
-    baby_persons: list[Person] = []
+    L'UPDATE prend le verrou d'écriture de SQLite avant de lire les max(id) :
+    deux écrivains concurrents ne peuvent donc pas obtenir les mêmes ids. Le
+    dernier id réservé est conservé (app_state « ids:<table> »), un id n'est
+    jamais réattribué, même après suppression.
+    """
+    key = f"ids:{table}"
+    session.execute(text("INSERT OR IGNORE INTO app_state (key, value) VALUES (:key, '0')"), {"key": key})
+    last = session.execute(text(
+        "UPDATE app_state SET value = max(CAST(value AS INTEGER), "
+        f"coalesce((SELECT max(id) FROM main.{table}), 0), "
+        f"coalesce((SELECT max(id) FROM archive.{table}), 0)) + :count "
+        "WHERE key = :key RETURNING value"
+    ), {"key": key, "count": count}).scalar()
+    return int(last) - count + 1
 
-    for f in families:
-        persons_list = f.persons.all()
-
-        rooms = [r for r in (f.room_number, f.room_number2) if r]
-        if rooms:
-            per_room = math.ceil(len(persons_list) / len(rooms))
-            for r in rooms:
-                capacity = room_capacity(r, cfg)
-                if capacity and per_room > capacity:
-                    overcrowded_rooms.append(
-                        {
-                            "family": f,
-                            "room": r,
-                            "person_count": per_room,
-                            "capacity": capacity,
-                        }
-                    )
 
-        adult_females: list[Person] = []
-        has_adult_male = False
-        for p in persons_list:
-            a = age_years(p.dob, today)
-            if a is None:
-                continue
-            if a >= 18:
-                if p.sex == "M":
-                    has_adult_male = True
-                elif p.sex == "F":
-                    adult_females.append(p)
-            if a < baby_age:
-                baby_persons.append(p)
-        if adult_females and not has_adult_male:
-            isolated_women.extend(adult_females)
+@event.listens_for(db.session, "before_flush")
+def assign_unique_ids(session, _ctx, _instances):
+    """Attribue aux nouvelles lignes un id jamais utilisé, archives comprises.
 
-    return render_template(
-        "dashboard.html",
-        total_clients=len(persons),
-        sex_labels=list(sex_counts.keys()),
-        sex_values=list(sex_counts.values()),
-        sex_child_values=[girl_count, boy_count, 0],
-        age_labels=list(age_counts.keys()),
-        age_f_values=[age_counts[k]["F"] for k in age_counts.keys()],
-        age_m_values=[age_counts[k]["M"] for k in age_counts.keys()],
-        age_colors_f=AGE_COLORS_F,
-        age_colors_m=AGE_COLORS_M,
-        old_labels=old_labels,
-        old_values=old_values,
-        old_tenures=old_tenures,
-        recent_labels=recent_labels,
-        recent_values=recent_values,
-        recent_tenures=recent_tenures,
-        oldest_adults=oldest_adults,
-        youngest_adults=youngest_adults,
-        oldest_children=oldest_children,
-        youngest_children=youngest_children,
-        families=families,
-        birthdays_today=birthdays_today,
-        birthdays_week_ahead=birthdays_week_ahead,
-        birthdays_week_past=birthdays_week_past,
-        birthdays_month_ahead=birthdays_month_ahead,
-        birthdays_month_past=birthdays_month_past,
-        adult_female_count=adult_female_count,
-        adult_male_count=adult_male_count,
-        girl_count=girl_count,
-        boy_count=boy_count,
-        overcrowded_rooms=overcrowded_rooms,
-        isolated_women=isolated_women,
-        baby_persons=baby_persons,
-        baby_age=baby_age,
-        show_free_rooms=show_free_rooms,
-        show_overcrowded=show_overcrowded,
-        show_isolated_women=show_isolated_women,
-        show_baby_alert=show_baby_alert,
-        show_alert_box=show_alert_box,
-        show_total_clients=show_total_clients,
-        show_birthdays=show_birthdays,
-        show_tenures=show_tenures,
-        show_age_groups=show_age_groups,
-        show_room_layout=show_room_layout,
-        show_recent_families=show_recent_families,
-        sex_chart_diameter=sex_chart_diameter,
-        free_rooms=free_rooms,
-        room_data=room_data,
-        layout=cfg.get("layout", {}),
-        box_layout=box_layout,
-        Person=Person,
-    )
+    Sans cela SQLite réutiliserait l'id d'une famille archivée, ce qui créerait
+    un conflit lors de sa restauration.
+    """
+    for model in (Family, Person):
+        new = [o for o in session.new if type(o) is model and o.id is None]
+        if not new:
+            continue
+        with session.no_autoflush:
+            next_id = allocate_ids(session, model.__tablename__, len(new))
+        for obj in new:
+            obj.id = next_id
+            next_id += 1
 
-# ----- Familles -----
 
-@app.route("/families")
-def families_list():
-    q = Family.query.filter(Family.departure_date.is_(None))
-    room = (request.args.get("room") or "").strip()
-    label = (request.args.get("label") or "").strip()
-    dmin = parse_date(request.args.get("dmin"))
-    dmax = parse_date(request.args.get("dmax"))
+def archive_departed(today: date | None = None, cfg: dict | None = None) -> int:
+    """Déplace les familles parties depuis longtemps (et leurs membres) en archive.
 
-    if room:
-        q = q.filter(or_(Family.room_number.like(f"%{room}%"), Family.room_number2.like(f"%{room}%")))
-    if label:
-        q = q.filter(Family.label.like(f"%{label}%"))
-    if dmin:
-        q = q.filter(Family.arrival_date >= dmin)
-    if dmax:
-        q = q.filter(Family.arrival_date <= dmax)
+    Le déplacement se fait en une seule transaction. Retourne le nombre de familles archivées.
+    """
+    cfg = cfg or load_config()
+    today = today or date.today()
+    try:
+        after_days = int(cfg.get("archive", {}).get("after_days", 90))
+    except (TypeError, ValueError):
+        after_days = 90
+    cutoff = today - relativedelta(days=after_days)
+    ids = [
+        r[0]
+        for r in db.session.execute(
+            db.select(Family.id).where(Family.departure_date.isnot(None), Family.departure_date <= cutoff)
+        )
+    ]
+    fcols = ", ".join(FAMILY_COLUMNS)
+    pcols = ", ".join(PERSON_COLUMNS)
+    last_seq = db.session.execute(text("SELECT coalesce(max(seq), 0) FROM change_log")).scalar()
+    for start in range(0, len(ids), 500):
+        chunk = {"ids": ids[start:start + 500]}
+        for sql in (
+            "DELETE FROM archive.person WHERE family_id IN :ids",
+            "DELETE FROM archive.family WHERE id IN :ids",
+            f"INSERT INTO archive.family ({fcols}) SELECT {fcols} FROM main.family WHERE id IN :ids",
+            f"INSERT OR REPLACE INTO archive.person ({pcols}) SELECT {pcols} FROM main.person WHERE family_id IN :ids",
+            "DELETE FROM main.person WHERE family_id IN :ids",
+            "DELETE FROM main.family WHERE id IN :ids",
+            # Dans le journal des modifications, ces suppressions sont des passages en archive
+            "UPDATE change_log SET op = 'archive' WHERE seq > :last_seq AND op = 'delete' AND ("
+            "(table_name = 'family' AND row_id IN :ids) OR "
+            "(table_name = 'person' AND json_extract(data, '$.family_id') IN :ids))",
+        ):
+            db.session.execute(text(sql).bindparams(bindparam("ids", expanding=True)), chunk | {"last_seq": last_seq})
+    db.session.commit()
+    return len(ids)
+
+
+def unarchive_family(archived: ArchivedFamily) -> Family:
+    """Ramène une famille archivée (et ses membres) dans les tables actives."""
+    fam = Family(**{c: getattr(archived, c) for c in FAMILY_COLUMNS})
+    if db.session.get(Family, fam.id) is not None:
+        fam.id = None
+    for ap in archived.persons:
+        p = Person(**{c: getattr(ap, c) for c in PERSON_COLUMNS if c != "family_id"})
+        if db.session.get(Person, p.id) is not None:
+            p.id = None
+        p.family = fam
+    db.session.delete(archived)
+    db.session.flush()
+    db.session.add(fam)
+    db.session.flush()
+    return fam
+
+
+@daily_job
+def archive_departed_job(today: date) -> None:
+    archived = archive_departed(today)
+    if archived:
+        app.logger.info("%s famille(s) déplacée(s) en archive", archived)
+
+
+@app.cli.command("archive-departed")
+def archive_departed_command():
+    """Déplace immédiatement les familles parties en archive."""
+    print(f"{archive_departed()} famille(s) archivée(s)")
+
+# ----- Compteurs statistiques -----
+
+# Les totaux du dashboard sont tenus à jour par des triggers SQLite (ajout,
+# modification, suppression de personnes ; arrivée, départ/retour, suppression
+# de familles) : ils s'appliquent sous le verrou d'écriture, quel que soit le
+# chemin (ORM, insertions groupées, import, autre processus). Les âges
+# évoluant avec le temps, les compteurs sont datés (app_state « stats_date »,
+# date de référence des triggers) et avancés jour par jour par la tâche
+# quotidienne (flask daily-jobs) ; d'ici là, les lectures appliquent le
+# décalage en mémoire sans rien écrire.
+
+def person_stat_keys(sex: str | None, dob: date | None, ref: date) -> list[str]:
+    s = sex if sex in SEX_CHOICES else "Autre/NP"
+    keys = ["total", f"sex:{s}"]
+    a = age_years(dob, ref)
+    if a is not None and s in ("F", "M"):
+        b = bucket_for_age(a)
+        if b:
+            keys.append(f"age:{b}:{s}")
+        keys.append(f"{'child' if a < 18 else 'adult'}:{s}")
+    return keys
+
+
+def add_stat_keys(deltas: dict[str, int], sex, dob, ref: date, sign: int) -> None:
+    for k in person_stat_keys(sex, dob, ref):
+        deltas[k] = deltas.get(k, 0) + sign
+
+
+def apply_counter_deltas(session, deltas: dict[str, int]) -> None:
+    for key, delta in deltas.items():
+        if delta:
+            session.execute(
+                text(
+                    "INSERT INTO stat_counter (key, value) VALUES (:key, :delta) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + :delta"
+                ),
+                {"key": key, "delta": delta},
+            )
+
+
+def compute_counters(today: date, session=db.session) -> dict[str, int]:
+    """Recalcule tous les compteurs à partir des personnes présentes."""
+    counters: dict[str, int] = {}
+    rows = session.execute(
+        db.select(Person.sex, Person.dob).join(Family).where(Family.departure_date.is_(None))
+    )
+    for sex, dob in rows:
+        add_stat_keys(counters, sex, dob, today, 1)
+    return counters
+
+
+def rebuild_counters(today: date | None = None) -> None:
+    today = today or date.today()
+    db.session.execute(text("DELETE FROM stat_counter"))
+    apply_counter_deltas(db.session, compute_counters(today))
+    db.session.execute(
+        text("INSERT OR REPLACE INTO app_state (key, value) VALUES ('stats_date', :today)"),
+        {"today": today.isoformat()},
+    )
+    db.session.commit()
+
+
+def stat_counter_sql(sign: str, persons: str) -> str:
+    """INSERT ajoutant ``sign`` aux compteurs de chaque ligne de ``persons``
+    (sous-requête fournissant ``sex`` et ``dob``) ; même clés que person_stat_keys,
+    âges calculés à la date « stats_date »."""
+    ref = "(SELECT value FROM app_state WHERE key = 'stats_date')"
+    dob = "CAST(replace(dob, '-', '') AS INTEGER)"
+    # Né un 29 février : un an de plus le 28 février des années non bissextiles
+    leap = f"strftime('%j', substr({ref}, 1, 4) || '-12-31') = '366'"
+    age = f"(CAST(replace({ref}, '-', '') AS INTEGER) - ({dob} - ({dob} % 10000 = 229 AND NOT {leap}))) / 10000"
+    bucket = "CASE " + " ".join(f"WHEN a BETWEEN {lo} AND {hi} THEN '{label}'" for label, lo, hi in AGE_BUCKETS) + " END"
+    return (
+        "INSERT INTO stat_counter (key, value) SELECT key, sum(n) FROM ("
+        "SELECT CASE slot WHEN 0 THEN 'total' WHEN 1 THEN 'sex:' || s "
+        f"WHEN 2 THEN CASE WHEN a IS NOT NULL AND s IN ('F', 'M') THEN 'age:' || {bucket} || ':' || s END "
+        "ELSE CASE WHEN a IS NOT NULL AND s IN ('F', 'M') THEN CASE WHEN a < 18 THEN 'child:' ELSE 'adult:' END || s END "
+        f"END AS key, {sign} AS n FROM ("
+        "SELECT CASE WHEN sex IN ('F', 'M', 'Autre/NP') THEN sex ELSE 'Autre/NP' END AS s, "
+        f"CASE WHEN dob IS NOT NULL THEN {age} END AS a FROM ({persons})"
+        ") JOIN (SELECT 0 AS slot UNION ALL SELECT 1 UNION ALL SELECT 2 UNION ALL SELECT 3)"
+        ") WHERE key IS NOT NULL GROUP BY key "
+        "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value;"
+    )
+
+
+def stat_counter_triggers() -> list[str]:
+    active = "EXISTS (SELECT 1 FROM family WHERE id = {row}.family_id AND departure_date IS NULL)"
+    person = "SELECT {row}.sex AS sex, {row}.dob AS dob WHERE " + active
+    members = "SELECT sex, dob FROM person WHERE family_id = {row}.id"
+    triggers = (
+        ("person_insert_stats", "AFTER INSERT ON person", "", stat_counter_sql("1", person.format(row="NEW"))),
+        ("person_delete_stats", "AFTER DELETE ON person", "", stat_counter_sql("-1", person.format(row="OLD"))),
+        ("person_update_stats", "AFTER UPDATE OF family_id, sex, dob ON person", "",
+         stat_counter_sql("-1", person.format(row="OLD")) + " " + stat_counter_sql("1", person.format(row="NEW"))),
+        # Arrivée d'une famille dont les membres sont déjà en base (restauration)
+        ("family_insert_stats", "AFTER INSERT ON family", "WHEN NEW.departure_date IS NULL",
+         stat_counter_sql("1", members.format(row="NEW"))),
+        ("family_update_stats", "AFTER UPDATE OF departure_date ON family",
+         "WHEN (OLD.departure_date IS NULL) != (NEW.departure_date IS NULL)",
+         stat_counter_sql("CASE WHEN NEW.departure_date IS NULL THEN 1 ELSE -1 END", members.format(row="NEW"))),
+        # Membres supprimés après la famille ; supprimés avant, ils ont déjà été décomptés
+        ("family_delete_stats", "AFTER DELETE ON family", "WHEN OLD.departure_date IS NULL",
+         stat_counter_sql("-1", members.format(row="OLD"))),
+    )
+    return [f"CREATE TRIGGER IF NOT EXISTS {name} {event} {when} BEGIN {body} END" for name, event, when, body in triggers]
+
+
+def _birthday_persons(session, day: date):
+    mds = {day.strftime("%m-%d")}
+    if (day.month, day.day) in ((2, 28), (3, 1)):
+        mds.add("02-29")
+    return session.execute(
+        db.select(Person.sex, Person.dob)
+        .join(Family)
+        .where(Family.departure_date.is_(None), func.strftime("%m-%d", Person.dob).in_(mds))
+    )
+
+
+def birthday_deltas(session, since: date, until: date) -> dict[str, int]:
+    """Écarts des compteurs entre deux dates : anniversaires des jours intermédiaires."""
+    deltas: dict[str, int] = {}
+    day = since
+    while day < until:
+        day += relativedelta(days=1)
+        for sex, dob in _birthday_persons(session, day):
+            add_stat_keys(deltas, sex, dob, day - relativedelta(days=1), -1)
+            add_stat_keys(deltas, sex, dob, day, 1)
+    return deltas
+
+
+def roll_counters(today: date | None = None) -> None:
+    """Avance les compteurs jusqu'à ``today`` : les personnes ayant eu leur
+    anniversaire changent de tranche d'âge (ou passent à l'âge adulte)."""
+    today = today or date.today()
+    current = db.session.execute(text("SELECT value FROM app_state WHERE key = 'stats_date'")).scalar()
+    stats_date = parse_date(current)
+    if stats_date is None or (today - stats_date).days > 400 or today < stats_date:
+        rebuild_counters(today)
+        return
+    if stats_date == today:
+        return
+    # Un seul processus applique le passage (mise à jour conditionnelle de la date) ;
+    # l'UPDATE prend le verrou d'écriture avant la lecture des anniversaires
+    claimed = db.session.execute(
+        text("UPDATE app_state SET value = :today WHERE key = 'stats_date' AND value = :current"),
+        {"today": today.isoformat(), "current": current},
+    ).rowcount
+    if claimed:
+        apply_counter_deltas(db.session, birthday_deltas(db.session, stats_date, today))
+    db.session.commit()
+
+
+def read_counters(today: date | None = None) -> dict:
+    """Totaux des personnes présentes (sexe, tranches d'âge, adultes/enfants).
+
+    Lecture seule : si la tâche quotidienne n'a pas encore avancé les compteurs,
+    le décalage depuis « stats_date » est calculé en mémoire.
+    """
+    today = today or date.today()
+    with reporting() as rs:
+        values = {k: v for k, v in rs.execute(db.select(StatCounter.key, StatCounter.value))}
+        stats_date = parse_date(rs.execute(text("SELECT value FROM app_state WHERE key = 'stats_date'")).scalar())
+        if stats_date != today:
+            if stats_date is None or today < stats_date or (today - stats_date).days > 400:
+                values = compute_counters(today, rs)
+            else:
+                for key, delta in birthday_deltas(rs, stats_date, today).items():
+                    values[key] = values.get(key, 0) + delta
+    return {
+        "total_clients": values.get("total", 0),
+        "sex_counts": {k: values.get(f"sex:{k}", 0) for k in SEX_CHOICES},
+        "age_counts": {
+            b[0]: {s: values.get(f"age:{b[0]}:{s}", 0) for s in ("F", "M")} for b in AGE_BUCKETS
+        },
+        "adult_female_count": values.get("adult:F", 0),
+        "adult_male_count": values.get("adult:M", 0),
+        "girl_count": values.get("child:F", 0),
+        "boy_count": values.get("child:M", 0),
+    }
+
+
+@daily_job
+def roll_counters_job(today: date) -> None:
+    roll_counters(today)
+
+
+@app.cli.command("stats-check")
+@click.option("--fix", is_flag=True, help="Corrige les compteurs en cas d'écart.")
+def stats_check_command(fix):
+    """Recalcule les compteurs depuis zéro et signale les écarts."""
+    today = date.today()
+    roll_counters(today)
+    expected = compute_counters(today)
+    stored = {k: v for k, v in db.session.execute(db.select(StatCounter.key, StatCounter.value))}
+    drift = {
+        k: (stored.get(k, 0), expected.get(k, 0))
+        for k in sorted(set(expected) | set(stored))
+        if stored.get(k, 0) != expected.get(k, 0)
+    }
+    if not drift:
+        print("Compteurs cohérents")
+        return
+    for key, (got, want) in drift.items():
+        print(f"{key}: {got} (attendu {want})")
+    if fix:
+        rebuild_counters(today)
+        print("Compteurs reconstruits")
+    else:
+        raise SystemExit(1)
+
+# ----- Journal des modifications -----
+
+# Chaque écriture sur family/person (routes, import, restauration, archivage)
+# ajoute une ligne numérotée à change_log via des triggers SQLite. Les
+# consommateurs se synchronisent avec /changes?since=N. Les entrées de plus de
+# CHANGE_LOG_RETAIN_DAYS jours sont supprimées ; le plus grand numéro supprimé
+# est conservé (app_state « changes_horizon ») pour signaler une resynchronisation.
+CHANGE_LOG_RETAIN_DAYS = 30
+CHANGE_LOG_PAGE = 500
+# Arrivée, départ ou retour d'une famille : passage de departure_date de/à NULL
+FAMILY_MOVEMENTS = {
+    "INSERT": "CASE WHEN NEW.departure_date IS NULL THEN 'arrival' END",
+    "UPDATE": (
+        "CASE WHEN OLD.departure_date IS NULL AND NEW.departure_date IS NOT NULL THEN 'departure' "
+        "WHEN OLD.departure_date IS NOT NULL AND NEW.departure_date IS NULL THEN 'return' END"
+    ),
+    "DELETE": "NULL",
+}
+
+
+def change_log_triggers() -> list[str]:
+    statements = []
+    for table, columns in (("family", FAMILY_COLUMNS), ("person", PERSON_COLUMNS)):
+        new_row = "json_object(" + ", ".join(f"'{c}', NEW.{c}" for c in columns) + ")"
+        old_row = "json_object('id', OLD.id" + (", 'family_id', OLD.family_id" if table == "person" else "") + ")"
+        for op, row, payload in (("INSERT", "NEW", new_row), ("UPDATE", "NEW", new_row), ("DELETE", "OLD", old_row)):
+            movement = FAMILY_MOVEMENTS[op] if table == "family" else "NULL"
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_changelog AFTER {op} ON {table} BEGIN "
+                "INSERT INTO change_log (at, table_name, op, row_id, data, movement) "
+                f"VALUES (CURRENT_TIMESTAMP, '{table}', '{op.lower()}', {row}.id, {payload}, {movement}); END"
+            )
+    return statements
+
+
+def install_triggers(statements: list[str]) -> None:
+    """Crée les triggers ``CREATE TRIGGER IF NOT EXISTS <nom> ...`` ; un trigger
+    existant dont la définition a changé est remplacé."""
+    existing = dict(db.session.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all())
+    for statement in statements:
+        name = statement.split()[5]
+        if existing.get(name) not in (None, statement.replace(" IF NOT EXISTS", "", 1)):
+            db.session.execute(text(f"DROP TRIGGER {name}"))
+        db.session.execute(text(statement))
+
+
+def change_log_horizon() -> int:
+    value = db.session.execute(text("SELECT value FROM app_state WHERE key = 'changes_horizon'")).scalar()
+    return int(value or 0)
+
+
+def compact_change_log(today: date | None = None) -> int:
+    """Supprime les entrées anciennes du journal ; retourne le nombre de lignes supprimées."""
+    today = today or date.today()
+    # ChangeLog.at est en UTC (CURRENT_TIMESTAMP) : minuit local converti en UTC
+    cutoff = datetime.combine(today - relativedelta(days=CHANGE_LOG_RETAIN_DAYS), time.min)
+    cutoff = cutoff.astimezone(timezone.utc).replace(tzinfo=None)
+    last = db.session.execute(db.select(func.max(ChangeLog.seq)).where(ChangeLog.at < cutoff)).scalar()
+    if last is None:
+        return 0
+    deleted = db.session.execute(db.delete(ChangeLog).where(ChangeLog.seq <= last)).rowcount
+    db.session.execute(
+        text("INSERT OR REPLACE INTO app_state (key, value) VALUES ('changes_horizon', :seq)"),
+        {"seq": str(max(last, change_log_horizon()))},
+    )
+    db.session.commit()
+    return deleted
+
+
+@daily_job
+def compact_change_log_job(today: date) -> None:
+    compact_change_log(today)
+
+
+@app.route("/changes")
+def changes():
+    since = request.args.get("since", type=int) or 0
+    limit = min(max(request.args.get("limit", CHANGE_LOG_PAGE, type=int), 1), 5000)
+    horizon = change_log_horizon()
+    if since < horizon:
+        # Les entrées demandées ont été compactées : repartir d'une sauvegarde complète
+        return {"error": "since est antérieur au journal conservé", "horizon": horizon}, 410
+    rows = db.session.execute(
+        db.select(ChangeLog).where(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit + 1)
+    ).scalars().all()
+    page = rows[:limit]
+    return {
+        "since": since,
+        "next": page[-1].seq if page else since,
+        "has_more": len(rows) > limit,
+        "changes": [
+            {
+                "seq": c.seq,
+                "at": c.at.isoformat(),
+                "table": c.table_name,
+                "op": c.op,
+                "id": c.row_id,
+                "data": json.loads(c.data) if c.data else None,
+            }
+            for c in page
+        ],
+    }
+
+# ----- Lectures de rapport (instantané en lecture seule) -----
+
+# Les lectures longues (exports, sauvegardes, recherches d'archives) passent
+# par une connexion séparée, ouverte en lecture seule. Chaque session de
+# rapport tient une seule transaction de lecture : en mode WAL, elle voit un
+# instantané cohérent de la base sans jamais bloquer les écritures.
+_report_sessions = None
+
+
+def _sqlite_uri(path: str, mode: str = "ro") -> str:
+    return f"file:{quote(path)}?mode={mode}"
+
+
+def report_sessionmaker():
+    global _report_sessions
+    if _report_sessions is None:
+        path = db.engine.url.database
+        if not path or path == ":memory:":
+            _report_sessions = sessionmaker(bind=db.engine)
+            return _report_sessions
+        engine = create_engine(f"sqlite:///{_sqlite_uri(path)}&uri=true")
+
+        @event.listens_for(engine, "connect")
+        def _connect(dbapi_conn, _record):
+            # Transactions gérées explicitement (voir _begin) pour couvrir les SELECT
+            dbapi_conn.isolation_level = None
+            dbapi_conn.execute("ATTACH DATABASE ? AS archive", (_sqlite_uri(archive_db_path(path)),))
+
+        @event.listens_for(engine, "begin")
+        def _begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        _report_sessions = sessionmaker(bind=engine)
+    return _report_sessions
+
+
+@contextmanager
+def reporting():
+    """Session en lecture seule sur un instantané cohérent de la base."""
+    session = report_sessionmaker()()
+    try:
+        yield session
+    finally:
+        session.close()
+
+# ============================
+# Routes
+# ============================
+
+# ----- Dashboard -----
+
+def active_families() -> list[Family]:
+    return Family.query.filter(Family.departure_date.is_(None)).order_by(
+        Family.arrival_date.desc().nullslast(), Family.id.desc()
+    ).all()
+
+
+# ----- Instantané des résidents -----
+
+# Les personnes et familles présentes sont recopiées en colonnes d'entiers dans
+# un fichier (<base>.snapshot) projeté en mémoire : tous les processus lisent
+# les mêmes pages, sans charger d'objets ORM. Le fichier est reconstruit quand
+# data_version change. Avec numpy, les calculs sur les colonnes sont vectorisés ;
+# sans numpy, les mêmes colonnes sont lues via memoryview.
+# Les listes et exports (noms, téléphones…) ont besoin de colonnes texte que
+# l'instantané ne contient pas : ils lisent des tuples de colonnes en SQL
+# (person_columns, family_columns), sans objets ORM non plus.
+SNAPSHOT_MAGIC = b"FLXSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sqiii4x")   # magic, data_version, personnes, familles, taille des chambres
+# (colonne, type array, table) ; chaque colonne est alignée sur 8 octets
+SNAPSHOT_COLUMNS = (
+    ("person_id", "i", "persons"),
+    ("person_family", "i", "persons"),
+    ("person_dob", "i", "persons"),        # AAAAMMJJ, 0 si inconnue
+    ("person_sex", "b", "persons"),        # indice dans SEX_CHOICES
+    ("family_id", "i", "families"),
+    ("family_arrival", "i", "families"),   # AAAAMMJJ, 0 si inconnue
+    ("family_room", "i", "families"),      # indice dans rooms, -1 si aucune
+    ("family_room2", "i", "families"),
+)
+_snapshot_state: dict = {}
+_snapshot_lock = threading.Lock()
+
+
+def date_key(d: date | None) -> int:
+    return d.year * 10000 + d.month * 100 + d.day if d else 0
+
+
+def snapshot_path() -> str:
+    return os.path.splitext(db.engine.url.database)[0] + ".snapshot"
+
+
+def snapshot_bytes() -> bytes:
+    """Contenu de l'instantané (en-tête, colonnes, chambres) lu dans la base."""
+    with reporting() as rs:
+        version = rs.execute(text("SELECT version FROM data_version WHERE id = 1")).scalar() or 0
+        persons = rs.execute(
+            db.select(Person.id, Person.family_id, Person.dob, Person.sex).join(Family)
+            .where(Family.departure_date.is_(None)).order_by(Person.id.asc())
+        ).all()
+        families = rs.execute(
+            db.select(Family.id, Family.arrival_date, Family.room_number, Family.room_number2)
+            .where(Family.departure_date.is_(None)).order_by(Family.id.asc())
+        ).all()
+    rooms = sorted({r for f in families for r in map(clean_field, (f.room_number, f.room_number2)) if r}, key=room_sort_key)
+    room_ids = {r: i for i, r in enumerate(rooms)}
+    sex_codes = {sex: i for i, sex in enumerate(SEX_CHOICES)}
+    values = {
+        "person_id": [p.id for p in persons],
+        "person_family": [p.family_id for p in persons],
+        "person_dob": [date_key(p.dob) for p in persons],
+        "person_sex": [sex_codes.get(p.sex, sex_codes["Autre/NP"]) for p in persons],
+        "family_id": [f.id for f in families],
+        "family_arrival": [date_key(f.arrival_date) for f in families],
+        "family_room": [room_ids.get(clean_field(f.room_number), -1) for f in families],
+        "family_room2": [room_ids.get(clean_field(f.room_number2), -1) for f in families],
+    }
+    rooms_blob = json.dumps(rooms, ensure_ascii=False).encode("utf-8")
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, len(persons), len(families), len(rooms_blob))]
+    for name, code, _table in SNAPSHOT_COLUMNS:
+        data = array(code, values[name]).tobytes()
+        parts.append(data + b"\0" * (-len(data) % 8))
+    parts.append(rooms_blob)
+    return b"".join(parts)
+
+
+def write_snapshot(path: str, data: bytes) -> None:
+    """Écrit un fichier temporaire propre à l'appel puis le met en place d'un coup."""
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def snapshot_column(buf, offset: int, count: int, code: str):
+    if np is not None:
+        return np.frombuffer(buf, dtype=np.dtype(code), count=count, offset=offset)
+    return memoryview(buf)[offset:offset + count * array(code).itemsize].cast(code)
+
+
+class ResidentSnapshot:
+    """Colonnes de l'instantané, lues directement dans le fichier projeté en mémoire."""
+
+    def __init__(self, buf):
+        magic, self.version, persons, families, rooms_size = SNAPSHOT_HEADER.unpack_from(buf)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("instantané invalide")
+        offset = SNAPSHOT_HEADER.size
+        for name, code, table in SNAPSHOT_COLUMNS:
+            count = persons if table == "persons" else families
+            setattr(self, name, snapshot_column(buf, offset, count, code))
+            size = count * array(code).itemsize
+            offset += size + (-size % 8)
+        if offset + rooms_size > len(buf):
+            raise ValueError("instantané tronqué")
+        self.rooms = json.loads(bytes(buf[offset:offset + rooms_size]).decode("utf-8"))
+
+
+def load_snapshot(path: str) -> ResidentSnapshot | None:
+    try:
+        with open(path, "rb") as f:
+            return ResidentSnapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def resident_snapshot() -> ResidentSnapshot:
+    """Instantané à jour : celui du processus, sinon le fichier, sinon reconstruit.
+
+    Une seule reconstruction à la fois par processus ; si le fichier ne peut
+    être écrit ou relu, l'instantané reconstruit est gardé en mémoire.
+    """
+    version = data_version()[0]
+    snap = _snapshot_state.get("snapshot")
+    if snap is not None and snap.version == version:
+        return snap
+    with _snapshot_lock:
+        snap = _snapshot_state.get("snapshot")
+        if snap is not None and snap.version >= version:
+            return snap
+        path = snapshot_path()
+        snap = load_snapshot(path)
+        if snap is None or snap.version < version:
+            data = snapshot_bytes()
+            try:
+                write_snapshot(path, data)
+                snap = load_snapshot(path)
+            except OSError:
+                app.logger.exception("Instantané des résidents non écrit : %s", path)
+                snap = None
+            if snap is None or snap.version < version:
+                snap = ResidentSnapshot(data)
+        _snapshot_state["snapshot"] = snap
+    return snap
+
+
+def snapshot_ages(snap: ResidentSnapshot, today: date):
+    """Âge en années de chaque personne, comme age_years (0 si la date est inconnue)."""
+    ref = date_key(today)
+    leap = calendar.isleap(today.year)
+    if np is not None:
+        dob = snap.person_dob.astype(np.int64)
+        if not leap:
+            # Né un 29 février : un an de plus le 28 février des années non bissextiles
+            dob = np.where(dob % 10000 == 229, dob - 1, dob)
+        diff = ref - dob
+        # Division tronquée vers zéro, comme relativedelta (naissance postérieure à ``today``)
+        return np.where(dob > 0, np.sign(diff) * (np.abs(diff) // 10000), 0)
+    ages = []
+    for k in snap.person_dob:
+        diff = ref - (k - 1 if not leap and k % 10000 == 229 else k)
+        ages.append((diff // 10000 if diff >= 0 else -(-diff // 10000)) if k else 0)
+    return ages
+
+
+def snapshot_select(keys: list, limit: int, mask=None) -> list[int]:
+    """Positions des ``limit`` premières lignes triées selon ``keys`` (clé principale en tête)."""
+    if np is not None:
+        positions = np.flatnonzero(mask) if mask is not None else np.arange(len(keys[0]))
+        order = np.lexsort(tuple(np.asarray(k)[positions] for k in reversed(keys)))
+        return positions[order[:limit]].tolist()
+    positions = [i for i in range(len(keys[0])) if mask is None or mask[i]]
+    return sorted(positions, key=lambda i: tuple(k[i] for k in keys))[:limit]
+
+
+def snapshot_birthday_ids(snap: ResidentSnapshot, days: list[date]) -> list[int]:
+    """Personnes dont l'anniversaire tombe l'un des jours donnés (29 février : 28/02 et 01/03)."""
+    mmdd = {d.month * 100 + d.day for d in days}
+    if mmdd & {228, 301}:
+        mmdd.add(229)
+    if np is not None:
+        dob = snap.person_dob
+        return snap.person_id[(dob > 0) & np.isin(dob % 10000, list(mmdd))].tolist()
+    return [pid for pid, k in zip(snap.person_id, snap.person_dob) if k and k % 10000 in mmdd]
+
+
+def snapshot_rooms(snap: ResidentSnapshot) -> set[str]:
+    """Chambres occupées par les familles présentes."""
+    if np is not None:
+        used = np.unique(np.concatenate((snap.family_room, snap.family_room2)))
+        return {snap.rooms[i] for i in used.tolist() if i >= 0}
+    return {snap.rooms[i] for i in (*snap.family_room, *snap.family_room2) if i >= 0}
+
+
+def persons_by_id(ids: list[int]) -> dict[int, Person]:
+    """Personnes par id ; celles supprimées depuis la lecture de l'instantané sont absentes."""
+    rows = db.session.execute(
+        db.select(Person).join(Person.family).where(Person.id.in_(ids)).options(contains_eager(Person.family))
+    ).scalars()
+    return {p.id: p for p in rows}
+
+
+# Entrées partagées par les encadrés : nom -> (fonction, entrées requises).
+# Chaque entrée est calculée au plus une fois par requête, et seulement si
+# un encadré activé la lit.
+DASHBOARD_INPUTS = {
+    "snapshot": (lambda inputs: resident_snapshot(), ()),
+    "families": (lambda inputs: active_families(), ()),
+    "counts": (lambda inputs: read_counters(inputs.today), ()),
+}
+
+
+class DashboardInputs:
+    """Accès paresseux aux entrées déclarées par un encadré."""
+
+    def __init__(self, cfg: dict, today: date, needs: tuple[str, ...]):
+        self.cfg = cfg
+        self.today = today
+        self._allowed: set[str] = set()
+        self._cache: dict = {}
+        pending = list(needs)
+        while pending:
+            name = pending.pop()
+            if name not in self._allowed:
+                self._allowed.add(name)
+                pending.extend(DASHBOARD_INPUTS[name][1])
+
+    def __getitem__(self, name: str):
+        if name not in self._allowed:
+            raise KeyError(f"Entrée de dashboard non déclarée : {name}")
+        if name not in self._cache:
+            self._cache[name] = DASHBOARD_INPUTS[name][0](self)
+        return self._cache[name]
+
+
+# Registre des encadrés : nom -> {"build", "needs", "enabled"}.
+# Le fragment correspondant est templates/widgets/<nom>.html.
+DASHBOARD_WIDGETS: dict[str, dict] = {}
+
+
+def dashboard_widget(name: str, needs: tuple[str, ...] = (), enabled=None):
+    """Enregistre un encadré du dashboard et les entrées dont il dépend."""
+    def decorator(build):
+        DASHBOARD_WIDGETS[name] = {
+            "build": build,
+            "needs": needs,
+            "enabled": enabled or (lambda cfg: True),
+        }
+        return build
+    return decorator
+
+
+def dashboard_flag(key: str):
+    return lambda cfg: cfg.get("dashboard", {}).get(key, True)
+
+
+def alerts_enabled(cfg: dict) -> bool:
+    alerts_cfg = cfg.get("alerts", {})
+    return dashboard_flag("show_alerts")(cfg) and any(
+        alerts_cfg.get(k, True)
+        for k in ("show_free_rooms", "show_overcrowded", "show_isolated_women", "show_baby_alert")
+    )
+
+
+def enabled_widgets(cfg: dict) -> list[str]:
+    return [name for name, w in DASHBOARD_WIDGETS.items() if w["enabled"](cfg)]
+
+
+def build_widget(name: str, cfg: dict, today: date) -> dict:
+    widget = DASHBOARD_WIDGETS[name]
+    return widget["build"](DashboardInputs(cfg, today, widget["needs"]))
+
+
+# ----- Alertes -----
+
+# Les alertes sont calculées à l'écriture, famille par famille, et rangées dans
+# la table alert. Une famille est réévaluée quand sa version (family_version)
+# diffère de celle de son dernier calcul (alert_state) : après chaque flush qui
+# touche familles ou personnes, et au commit pour les écritures groupées. Un
+# changement de la configuration utile (occupation, âge des bébés), à son
+# enregistrement, et la tâche quotidienne (âges qui changent) recalculent
+# toutes les familles. Les lectures n'écrivent jamais.
+#
+# Une règle reçoit la famille, ses membres, la configuration et la date, et
+# retourne des alertes {"person_id", "room", "data"} (toutes facultatives).
+ALERT_RULES: dict[str, Callable[..., list[dict]]] = {}
+
+
+def alert_rule(kind: str):
+    """Enregistre une règle d'alerte."""
+    def decorator(rule):
+        ALERT_RULES[kind] = rule
+        return rule
+    return decorator
+
+
+@alert_rule("overcrowded")
+def overcrowded_rule(family, persons, cfg: dict, today: date) -> list[dict]:
+    rooms = [r for r in (family.room_number, family.room_number2) if r]
+    if not rooms:
+        return []
+    per_room = math.ceil(len(persons) / len(rooms))
+    alerts = []
+    for r in rooms:
+        capacity = room_capacity(r, cfg)
+        if capacity and per_room > capacity:
+            alerts.append({"room": r, "data": {"person_count": per_room, "capacity": capacity}})
+    return alerts
+
+
+@alert_rule("isolated_woman")
+def isolated_woman_rule(family, persons, cfg: dict, today: date) -> list[dict]:
+    adult_females = []
+    for p in persons:
+        a = age_years(p.dob, today)
+        if a is not None and a >= 18:
+            if p.sex == "M":
+                return []
+            if p.sex == "F":
+                adult_females.append({"person_id": p.id})
+    return adult_females
+
+
+@alert_rule("baby")
+def baby_rule(family, persons, cfg: dict, today: date) -> list[dict]:
+    baby_age = cfg.get("alerts", {}).get("baby_age", 1)
+    return [{"person_id": p.id} for p in persons if (a := age_years(p.dob, today)) is not None and a < baby_age]
+
+
+def alerts_config_key(cfg: dict) -> str:
+    relevant = {"occupation": cfg.get("occupation"), "alerts": cfg.get("alerts"), "rules": sorted(ALERT_RULES)}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def evaluate_alerts(session, ids: list[int], cfg: dict, today: date) -> None:
+    """Recalcule les alertes des familles ``ids`` (familles parties ou supprimées : aucune)."""
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        versions = dict(session.execute(
+            db.select(FamilyVersion.family_id, FamilyVersion.version).where(FamilyVersion.family_id.in_(chunk))
+        ).all())
+        families = session.execute(
+            db.select(Family.id, Family.room_number, Family.room_number2)
+            .where(Family.id.in_(chunk), Family.departure_date.is_(None))
+        ).all()
+        persons: dict[int, list] = {}
+        for p in session.execute(
+            db.select(Person.id, Person.family_id, Person.sex, Person.dob)
+            .where(Person.family_id.in_(chunk)).order_by(Person.id.asc())
+        ):
+            persons.setdefault(p.family_id, []).append(p)
+        rows = []
+        for f in families:
+            for kind, rule in ALERT_RULES.items():
+                for alert in rule(f, persons.get(f.id, []), cfg, today):
+                    rows.append({
+                        "kind": kind,
+                        "family_id": f.id,
+                        "person_id": alert.get("person_id"),
+                        "room": alert.get("room"),
+                        "data": json.dumps(alert["data"]) if alert.get("data") else None,
+                    })
+        session.execute(db.delete(Alert).where(Alert.family_id.in_(chunk)))
+        if rows:
+            session.execute(insert(Alert), rows)
+        session.execute(
+            text(
+                "INSERT INTO alert_state (family_id, version) VALUES (:fid, :version) "
+                "ON CONFLICT(family_id) DO UPDATE SET version = excluded.version"
+            ),
+            [{"fid": fid, "version": versions.get(fid, 0)} for fid in chunk],
+        )
+
+
+def refresh_alerts(session, cfg: dict | None = None, today: date | None = None) -> None:
+    """Recalcule les alertes de toutes les familles présentes."""
+    cfg = cfg or alerts_config()[1]
+    session.execute(db.delete(Alert))
+    session.execute(db.delete(AlertState))
+    ids = session.execute(db.select(Family.id).where(Family.departure_date.is_(None))).scalars().all()
+    evaluate_alerts(session, ids, cfg, today or date.today())
+    session.execute(
+        text("INSERT OR REPLACE INTO app_state (key, value) VALUES ('alerts_config', :key)"),
+        {"key": alerts_config_key(cfg)},
+    )
+
+
+# (config_version, configuration, clé) ; version de config.json pour laquelle
+# la clé stockée (app_state « alerts_config ») a été vérifiée.
+_alerts_config: tuple | None = None
+_alerts_checked: str | None = None
+
+
+def alerts_config() -> tuple[str, dict, str]:
+    """Configuration utile aux alertes et sa clé, relues seulement quand config.json change."""
+    global _alerts_config
+    cached = _alerts_config
+    version = config_version()
+    if cached is None or cached[0] != version:
+        cfg = load_config()
+        cached = _alerts_config = (version, cfg, alerts_config_key(cfg))
+    return cached
+
+
+def sync_alerts(session, ids: set[int] | None = None) -> bool:
+    """Réévalue les familles ``ids`` (par défaut : celles modifiées depuis leur
+    dernier calcul) ; indique s'il y en avait."""
+    global _alerts_checked
+    version, cfg, key = alerts_config()
+    if _alerts_checked != version:
+        stored = session.execute(text("SELECT value FROM app_state WHERE key = 'alerts_config'")).scalar()
+        if stored != key:
+            refresh_alerts(session, cfg)
+            return True
+        _alerts_checked = version
+    if ids is None:
+        ids = session.execute(
+            db.select(FamilyVersion.family_id)
+            .outerjoin(AlertState, AlertState.family_id == FamilyVersion.family_id)
+            .where(or_(AlertState.version.is_(None), AlertState.version != FamilyVersion.version))
+        ).scalars().all()
+    if ids:
+        evaluate_alerts(session, sorted(ids), cfg, date.today())
+    return bool(ids)
+
+
+@event.listens_for(db.session, "after_flush")
+def evaluate_alerts_on_flush(session, _ctx):
+    """Réévalue seulement les familles touchées par le flush (ancienne famille comprise)."""
+    ids = set()
+    for o in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(o, Family):
+            ids.add(o.id)
+        elif isinstance(o, Person):
+            ids.add(o.family_id)
+            ids.update(inspect(o).attrs.family_id.history.deleted)
+    ids.discard(None)
+    if ids:
+        sync_alerts(session, ids)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def track_bulk_writes(state):
+    """Note les écritures groupées sur familles ou personnes, qui ne passent pas par le flush."""
+    mapper = state.bind_mapper
+    if (state.is_insert or state.is_update or state.is_delete) and mapper is not None and mapper.class_ in (Family, Person):
+        state.session.info["bulk_writes"] = True
+
+
+@event.listens_for(db.session, "before_commit")
+def evaluate_alerts_on_commit(session):
+    if session.info.pop("bulk_writes", False):
+        sync_alerts(session)
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_bulk_writes(session):
+    session.info.pop("bulk_writes", None)
+
+
+@daily_job
+def refresh_alerts_job(today: date) -> None:
+    refresh_alerts(db.session, today=today)
+    db.session.commit()
+
+
+@dashboard_widget("alerts", needs=("snapshot",), enabled=alerts_enabled)
+def widget_alerts(inputs: DashboardInputs) -> dict:
+    cfg = inputs.cfg
+    alerts_cfg = cfg.get("alerts", {})
+    baby_age = alerts_cfg.get("baby_age", 1)
+    show_free_rooms = alerts_cfg.get("show_free_rooms", True)
+    show_overcrowded = alerts_cfg.get("show_overcrowded", True)
+    show_isolated_women = alerts_cfg.get("show_isolated_women", True)
+    show_baby_alert = alerts_cfg.get("show_baby_alert", True)
+
+    # Chambres libres
+    free_rooms: list[str] = []
+    if show_free_rooms:
+        free_rooms = sorted(
+            set(generate_rooms(cfg)) - snapshot_rooms(inputs["snapshot"]),
+            key=lambda x: int(x) if x.isdigit() else x,
+        )
+
+    order = (Family.arrival_date.desc().nullslast(), Family.id.desc(), Alert.id.asc())
+    overcrowded_rooms: list[dict] = []
+    if show_overcrowded:
+        rows = db.session.execute(
+            db.select(Alert, Family).join(Family, Family.id == Alert.family_id)
+            .where(Alert.kind == "overcrowded").order_by(*order)
+        )
+        for alert, family in rows:
+            data = json.loads(alert.data)
+            overcrowded_rooms.append(
+                {"family": family, "room": alert.room, "person_count": data["person_count"], "capacity": data["capacity"]}
+            )
+
+    def alert_persons(kind: str) -> list[Person]:
+        return db.session.execute(
+            db.select(Person).join(Alert, Alert.person_id == Person.id).join(Person.family)
+            .where(Alert.kind == kind).options(contains_eager(Person.family)).order_by(*order)
+        ).scalars().all()
+
+    return {
+        "free_rooms": free_rooms,
+        "overcrowded_rooms": overcrowded_rooms,
+        "isolated_women": alert_persons("isolated_woman") if show_isolated_women else [],
+        "baby_persons": alert_persons("baby") if show_baby_alert else [],
+        "baby_age": baby_age,
+        "show_free_rooms": show_free_rooms,
+        "show_overcrowded": show_overcrowded,
+        "show_isolated_women": show_isolated_women,
+        "show_baby_alert": show_baby_alert,
+    }
+
+
+@app.route("/api/alerts")
+def api_alerts():
+    q = (
+        db.select(Alert, Family.label, Person.first_name, Person.last_name)
+        .join(Family, Family.id == Alert.family_id)
+        .outerjoin(Person, Person.id == Alert.person_id)
+        .order_by(Alert.kind, Family.id, Alert.id)
+    )
+    if request.args.get("kind"):
+        q = q.where(Alert.kind == request.args["kind"])
+    if request.args.get("family", type=int) is not None:
+        q = q.where(Alert.family_id == request.args.get("family", type=int))
+    alerts = [
+        {
+            "kind": alert.kind,
+            "family_id": alert.family_id,
+            "family_label": label,
+            "person_id": alert.person_id,
+            "person": f"{first} {last}" if alert.person_id else None,
+            "room": alert.room,
+            "data": json.loads(alert.data) if alert.data else None,
+        }
+        for alert, label, first, last in db.session.execute(q)
+    ]
+    counts: dict[str, int] = {kind: 0 for kind in ALERT_RULES}
+    for alert in alerts:
+        counts[alert["kind"]] += 1
+    return {"counts": counts, "alerts": alerts}
+
+
+@dashboard_widget("total_clients", needs=("counts",), enabled=dashboard_flag("show_total_clients"))
+def widget_total_clients(inputs: DashboardInputs) -> dict:
+    return inputs["counts"]
+
+
+@dashboard_widget("sex_chart", needs=("counts",))
+def widget_sex_chart(inputs: DashboardInputs) -> dict:
+    counts = inputs["counts"]
+    return {
+        "sex_labels": list(counts["sex_counts"].keys()),
+        "sex_values": list(counts["sex_counts"].values()),
+        "sex_child_values": [counts["girl_count"], counts["boy_count"], 0],
+        "sex_chart_diameter": inputs.cfg.get("dashboard", {}).get("sex_chart_diameter", 200),
+    }
+
+
+@dashboard_widget("age_groups", needs=("counts",), enabled=dashboard_flag("show_age_groups"))
+def widget_age_groups(inputs: DashboardInputs) -> dict:
+    age_counts = inputs["counts"]["age_counts"]
+    return {
+        "age_labels": list(age_counts.keys()),
+        "age_f_values": [age_counts[k]["F"] for k in age_counts.keys()],
+        "age_m_values": [age_counts[k]["M"] for k in age_counts.keys()],
+        "age_colors_f": AGE_COLORS_F,
+        "age_colors_m": AGE_COLORS_M,
+    }
+
+
+@dashboard_widget("birthdays", needs=("snapshot",), enabled=dashboard_flag("show_birthdays"))
+def widget_birthdays(inputs: DashboardInputs) -> dict:
+    today = inputs.today
+    # Anniversaires (semaine/mois passés et à venir)
+    birthdays_today: list[dict] = []
+    birthdays_week_ahead: list[dict] = []
+    birthdays_week_past: list[dict] = []
+    birthdays_month_ahead: list[dict] = []
+    birthdays_month_past: list[dict] = []
+
+    week_ahead_end = today + relativedelta(weeks=1)
+    month_ahead_end = today + relativedelta(months=1)
+    week_past_start = today - relativedelta(weeks=1)
+    month_past_start = today - relativedelta(months=1)
+
+    # Seules les personnes nées un jour de la fenêtre (±1 mois) sont chargées
+    window = [today + timedelta(days=k) for k in range(-32, 33)]
+    candidates = persons_by_id(snapshot_birthday_ids(inputs["snapshot"], window))
+    for p in sorted(candidates.values(), key=lambda p: p.id):
+        if not p.dob:
+            continue
+        dob_this_year = p.dob.replace(year=today.year)
+        if dob_this_year == today:
+            birthdays_today.append({
+                "person": p,
+                "age": age_years(p.dob, today),
+            })
+            continue
+
+        next_bd = dob_this_year if dob_this_year > today else dob_this_year.replace(year=today.year + 1)
+        prev_bd = dob_this_year if dob_this_year < today else dob_this_year.replace(year=today.year - 1)
+
+        if today < next_bd <= week_ahead_end:
+            birthdays_week_ahead.append({
+                "person": p,
+                "date": next_bd,
+                "age": age_years(p.dob, next_bd),
+            })
+        elif today < next_bd <= month_ahead_end:
+            birthdays_month_ahead.append({
+                "person": p,
+                "date": next_bd,
+                "age": age_years(p.dob, next_bd),
+            })
+
+        if week_past_start <= prev_bd < today:
+            birthdays_week_past.append({
+                "person": p,
+                "date": prev_bd,
+                "age": age_years(p.dob, prev_bd),
+            })
+        elif month_past_start <= prev_bd < today:
+            birthdays_month_past.append({
+                "person": p,
+                "date": prev_bd,
+                "age": age_years(p.dob, prev_bd),
+            })
+
+    birthdays_week_ahead.sort(key=lambda b: b["date"])
+    birthdays_month_ahead.sort(key=lambda b: b["date"])
+    birthdays_week_past.sort(key=lambda b: b["date"], reverse=True)
+    birthdays_month_past.sort(key=lambda b: b["date"], reverse=True)
+
+    return {
+        "birthdays_today": birthdays_today,
+        "birthdays_week_ahead": birthdays_week_ahead,
+        "birthdays_week_past": birthdays_week_past,
+        "birthdays_month_ahead": birthdays_month_ahead,
+        "birthdays_month_past": birthdays_month_past,
+    }
+
+
+@dashboard_widget("tenures", needs=("snapshot",), enabled=dashboard_flag("show_tenures"))
+def widget_tenures(inputs: DashboardInputs) -> dict:
+    today = inputs.today
+    snap = inputs["snapshot"]
+    ages = snapshot_ages(snap, today)
+    pids = snap.person_id
+    if np is not None:
+        known = snap.person_dob > 0
+        neg_ages = -ages
+        is_adult, is_child = known & (ages >= 18), known & (ages < 18)
+    else:
+        neg_ages = [-a for a in ages]
+        is_adult = [k > 0 and a >= 18 for k, a in zip(snap.person_dob, ages)]
+        is_child = [k > 0 and a < 18 for k, a in zip(snap.person_dob, ages)]
+
+    # Listes des 5 adultes/enfants les plus âgés et les plus jeunes
+    picks = {
+        "oldest_adults": snapshot_select([neg_ages, pids], 5, is_adult),
+        "youngest_adults": snapshot_select([ages, pids], 5, is_adult),
+        "oldest_children": snapshot_select([neg_ages, pids], 5, is_child),
+        "youngest_children": snapshot_select([ages, pids], 5, is_child),
+    }
+    # Une ligne supprimée depuis la lecture de l'instantané est simplement ignorée
+    persons = persons_by_id([int(pids[i]) for rows in picks.values() for i in rows])
+    picks = {name: [persons[pid] for pid in (int(pids[i]) for i in rows) if pid in persons] for name, rows in picks.items()}
+
+    # Familles récentes et ancienneté
+    arrival, fids = snap.family_arrival, snap.family_id
+    if np is not None:
+        unknown, neg_arrival, neg_fids = arrival == 0, -arrival, -fids
+    else:
+        unknown, neg_arrival, neg_fids = [a == 0 for a in arrival], [-a for a in arrival], [-i for i in fids]
+    recent = [int(fids[i]) for i in snapshot_select([unknown, neg_arrival, neg_fids], 5)]
+    old = [int(fids[i]) for i in snapshot_select([unknown, arrival, fids], 5)]
+    loaded = {f.id: f for f in Family.query.filter(Family.id.in_(recent + old))}
+    recent_families = [loaded[i] for i in recent if i in loaded]
+    old_families = [loaded[i] for i in old if i in loaded]
+
+    def days_since(arrival: date | None) -> int:
+        return (today - arrival).days if arrival else 0
+
+    def tenure_text(arrival: date | None) -> str:
+        if not arrival:
+            return "(0 jour)"
+        rd = relativedelta(today, arrival)
+        return f"({rd.years} ans et {rd.months} mois et {rd.days} jours)"
+
+    return {
+        "old_labels": [f.label or f"Famille {f.id}" for f in old_families],
+        "old_values": [days_since(f.arrival_date) for f in old_families],
+        "old_tenures": [tenure_text(f.arrival_date) for f in old_families],
+        "recent_labels": [f.label or f"Famille {f.id}" for f in recent_families],
+        "recent_values": [days_since(f.arrival_date) for f in recent_families],
+        "recent_tenures": [tenure_text(f.arrival_date) for f in recent_families],
+        **picks,
+    }
+
+
+@dashboard_widget("room_layout", needs=("families",), enabled=dashboard_flag("show_room_layout"))
+def widget_room_layout(inputs: DashboardInputs) -> dict:
+    room_data = {r: {"occupied": False, "family": None, "family_id": None} for r in generate_rooms(inputs.cfg)}
+    for f in inputs["families"]:
+        fam_label = f.label if f.label not in [None, "None"] else f"Famille {f.id}"
+        for r in (f.room_number, f.room_number2):
+            r = clean_field(r)
+            if r:
+                room_data[r] = {"occupied": True, "family": fam_label, "family_id": f.id}
+    return {"room_data": room_data, "floors": floor_layouts(inputs.cfg)}
+
+
+@dashboard_widget("recent_families", needs=("families",), enabled=dashboard_flag("show_recent_families"))
+def widget_recent_families(inputs: DashboardInputs) -> dict:
+    families = inputs["families"]
+    return {"families": families, "sizes": family_sizes([f.id for f in families])}
+
+
+@dashboard_widget(
+    "family_modals",
+    needs=("families",),
+    enabled=lambda cfg: dashboard_flag("show_room_layout")(cfg) or dashboard_flag("show_recent_families")(cfg),
+)
+def widget_family_modals(inputs: DashboardInputs) -> dict:
+    return {"modals": family_modals(inputs["families"], inputs.today)}
+
+
+@app.route("/")
+@conditional
+def dashboard():
+    cfg = load_config()
+    return render_template(
+        "dashboard.html",
+        widgets=enabled_widgets(cfg),
+        layout=cfg.get("layout", {}),
+        data_version=data_version()[0],
+        live_retry=LIVE_BUSY_RETRY_SECONDS,
+    )
+
+
+@app.route("/api/stats")
+@conditional
+def api_stats():
+    return read_counters()
+
+
+@app.route("/dashboard/widgets/<name>")
+@conditional
+def dashboard_widget_view(name):
+    cfg = load_config()
+    if name not in DASHBOARD_WIDGETS or not DASHBOARD_WIDGETS[name]["enabled"](cfg):
+        abort(404)
+    return render_template(f"widgets/{name}.html", **build_widget(name, cfg, date.today()))
+
+# ----- Mises à jour en direct (Server-Sent Events) -----
+
+# Les écrans d'accueil gardent /events ouvert. Un commit dans ce processus
+# réveille immédiatement les flux ; les écritures d'autres processus sont vues
+# au plus tard après LIVE_POLL_SECONDS (simple lecture de data_version). Le
+# résumé envoyé est calculé une seule fois par version des données, quel que
+# soit le nombre d'écrans.
+#
+# Chaque flux occupe un thread du serveur tant qu'il est ouvert : au-delà de
+# LIVE_MAX_STREAMS flux par processus (FLEXILOGIS_LIVE_STREAMS), /events répond
+# 503 et l'écran réessaie après LIVE_BUSY_RETRY_SECONDS. Le serveur doit donc
+# disposer de plus de threads que de flux autorisés (voir README).
+LIVE_POLL_SECONDS = 5
+LIVE_HEARTBEAT_SECONDS = 25
+LIVE_MAX_STREAMS = int(os.environ.get("FLEXILOGIS_LIVE_STREAMS", "8"))
+LIVE_BUSY_RETRY_SECONDS = 30
+STAY_MOVEMENTS_PAGE = 200
+_live_streams = threading.BoundedSemaphore(LIVE_MAX_STREAMS)
+_live_cond = threading.Condition()
+_live_generation = 0
+_live_cache: tuple | None = None   # (clé, résumé), remplacé d'un bloc
+
+
+@event.listens_for(db.session, "after_commit")
+def notify_live_streams(_session):
+    global _live_generation
+    with _live_cond:
+        _live_generation += 1
+        _live_cond.notify_all()
+
+
+def live_key() -> tuple:
+    return data_version()[0], config_version(), date.today()
+
+
+def live_summary(key: tuple) -> dict:
+    """Occupation, chambres libres et nombre d'alertes pour une version donnée."""
+    global _live_cache
+    cached = _live_cache
+    if cached is None or cached[0] != key:
+        cfg = load_config()
+        today = key[2]
+        inputs = DashboardInputs(cfg, today, ("counts", "snapshot"))
+        counts = inputs["counts"]
+        rooms = generate_rooms(cfg)
+        occupied = snapshot_rooms(inputs["snapshot"])
+        alerts = build_widget("alerts", cfg, today)
+        cached = _live_cache = (key, {
+            "version": key[0],
+            "occupancy": {
+                "total_clients": counts["total_clients"],
+                "adult_female_count": counts["adult_female_count"],
+                "adult_male_count": counts["adult_male_count"],
+                "girl_count": counts["girl_count"],
+                "boy_count": counts["boy_count"],
+                "occupied_rooms": len(occupied),
+                "total_rooms": len(rooms),
+            },
+            "free_rooms": sorted(set(rooms) - occupied, key=room_sort_key),
+            "alerts": {
+                "overcrowded": len(alerts["overcrowded_rooms"]),
+                "isolated_women": len(alerts["isolated_women"]),
+                "babies": len(alerts["baby_persons"]),
+            },
+        })
+    return cached[1]
+
+
+def site_summary() -> dict:
+    """Chiffres du site, additionnables d'un site à l'autre (vue consolidée de sites.py)."""
+    key = live_key()
+    counts = read_counters(key[2])
+    live = live_summary(key)
+    return {
+        "version": key[0],
+        "counts": {
+            "total_clients": counts["total_clients"],
+            "sex_counts": counts["sex_counts"],
+            "age_counts": counts["age_counts"],
+        },
+        "occupancy": live["occupancy"],
+        "free_rooms": len(live["free_rooms"]),
+        "alerts": live["alerts"],
+    }
+
+
+def stay_movements(since: int) -> tuple[list[dict], list[dict], int, bool]:
+    """Arrivées et départs de familles enregistrés dans le journal après ``since``.
+
+    Retourne aussi le numéro de reprise et s'il reste des mouvements à lire
+    (au plus STAY_MOVEMENTS_PAGE par appel).
+    """
+    arrivals, departures = [], []
+    last = db.session.execute(db.select(func.coalesce(func.max(ChangeLog.seq), since))).scalar()
+    rows = db.session.execute(
+        db.select(ChangeLog.seq, ChangeLog.movement, ChangeLog.data)
+        .where(ChangeLog.seq > since, ChangeLog.seq <= last, ChangeLog.movement.in_(("arrival", "departure")))
+        .order_by(ChangeLog.seq).limit(STAY_MOVEMENTS_PAGE)
+    ).all()
+    for seq, movement, data in rows:
+        row = json.loads(data)
+        item = {"id": row["id"], "label": row.get("label"), "rooms": [r for r in (row.get("room_number"), row.get("room_number2")) if r]}
+        (arrivals if movement == "arrival" else departures).append(item)
+    more = len(rows) == STAY_MOVEMENTS_PAGE
+    if more:
+        last = rows[-1].seq
+    return arrivals, departures, max(last, since), more
+
+
+@app.route("/events")
+def events():
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = db.session.execute(db.select(func.coalesce(func.max(ChangeLog.seq), 0))).scalar()
+    if not _live_streams.acquire(blocking=False):
+        return (
+            {"error": "trop de flux ouverts", "retry": LIVE_BUSY_RETRY_SECONDS},
+            503,
+            {"Retry-After": str(LIVE_BUSY_RETRY_SECONDS)},
+        )
+
+    def stream(since):
+        yield f"retry: {LIVE_POLL_SECONDS * 1000}\n\n"
+        last_key = None
+        last_sent = monotonic()
+        more = False
+        while True:
+            generation = _live_generation
+            key = live_key()
+            if key != last_key or more:
+                arrivals, departures, since, more = stay_movements(since)
+                payload = live_summary(key) | {"arrivals": arrivals, "departures": departures}
+                # Ne pas garder de transaction ouverte entre deux réveils
+                db.session.close()
+                yield f"id: {since}\nevent: update\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                last_key, last_sent = key, monotonic()
+            else:
+                db.session.close()
+                if monotonic() - last_sent >= LIVE_HEARTBEAT_SECONDS:
+                    yield ": ping\n\n"
+                    last_sent = monotonic()
+            if more:
+                continue   # mouvements restants : page suivante sans attendre
+            with _live_cond:
+                _live_cond.wait_for(lambda: _live_generation != generation, LIVE_POLL_SECONDS)
+
+    resp = Response(stream_with_context(stream(since)), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    # Libéré à la fermeture de la réponse, même si le flux n'a jamais été lu
+    resp.call_on_close(_live_streams.release)
+    return resp
+
+# ----- Fragments par famille -----
+
+# La fiche d'une famille (fenêtre avec la liste de ses membres) est rendue une
+# fois puis réutilisée tant que la famille et ses membres ne changent pas :
+# family_version est incrémentée par des triggers à chaque écriture. Les âges
+# affichés dépendent du jour, qui fait donc partie de la clé.
+FRAGMENT_CACHE_MAX = 5000
+_fragment_cache: dict[int, tuple] = {}
+
+
+def family_version_triggers() -> list[str]:
+    bump = (
+        "INSERT INTO family_version (family_id, version) VALUES ({id}, 1) "
+        "ON CONFLICT(family_id) DO UPDATE SET version = version + 1;"
+    )
+    statements = []
+    for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS family_{op.lower()}_fragment AFTER {op} ON family "
+            f"BEGIN {bump.format(id=f'{row}.id')} END"
+        )
+        body = bump.format(id=f"{row}.family_id")
+        if op == "UPDATE":
+            body += " " + bump.format(id="OLD.family_id")   # changement de famille
+        statements.append(f"CREATE TRIGGER IF NOT EXISTS person_{op.lower()}_fragment AFTER {op} ON person BEGIN {body} END")
+    return statements
+
+
+def family_versions(ids: list[int]) -> dict[int, int]:
+    versions = {}
+    for start in range(0, len(ids), 500):
+        versions.update(db.session.execute(
+            db.select(FamilyVersion.family_id, FamilyVersion.version)
+            .where(FamilyVersion.family_id.in_(ids[start:start + 500]))
+        ).all())
+    return versions
+
+
+def family_modals(families: list, today: date | None = None) -> list[Markup]:
+    """Fiches des familles ; seules celles qui ont changé sont de nouveau rendues."""
+    today = today or date.today()
+    versions = family_versions([f.id for f in families])
+    html: dict[int, Markup] = {}
+    missing = []
+    for f in families:
+        key = (versions.get(f.id, 0), today)
+        hit = _fragment_cache.get(f.id)
+        if hit is not None and hit[0] == key:
+            html[f.id] = hit[1]
+        else:
+            missing.append((f, key))
+    if missing:
+        ids = [f.id for f, _key in missing]
+        persons: dict[int, list[Person]] = {}
+        for start in range(0, len(ids), 500):
+            rows = db.session.execute(
+                db.select(Person).where(Person.family_id.in_(ids[start:start + 500])).order_by(Person.id.asc())
+            ).scalars()
+            for p in rows:
+                persons.setdefault(p.family_id, []).append(p)
+        if len(_fragment_cache) + len(missing) > FRAGMENT_CACHE_MAX:
+            _fragment_cache.clear()
+        for f, key in missing:
+            html[f.id] = Markup(render_template("family_modal.html", f=f, persons=persons.get(f.id, [])))
+            _fragment_cache[f.id] = (key, html[f.id])
+    return [html[f.id] for f in families]
+
+# ----- Familles -----
+
+@app.route("/families")
+@conditional
+def families_list():
+    q = Family.query.filter(Family.departure_date.is_(None))
+    room = (request.args.get("room") or "").strip()
+    label = (request.args.get("label") or "").strip()
+    dmin = parse_date(request.args.get("dmin"))
+    dmax = parse_date(request.args.get("dmax"))
+
+    if room:
+        q = q.filter(or_(Family.room_number.like(f"%{room}%"), Family.room_number2.like(f"%{room}%")))
+    if label:
+        q = q.filter(Family.label.like(f"%{label}%"))
+    if dmin:
+        q = q.filter(Family.arrival_date >= dmin)
+    if dmax:
+        q = q.filter(Family.arrival_date <= dmax)
 
     families = q.order_by(Family.arrival_date.desc().nullslast(), Family.id.desc()).all()
     return render_template(
         "families.html",
         families=families,
+        sizes=family_sizes([f.id for f in families]),
+        modals=family_modals(families),
         room=room,
         label=label,
         dmin=request.args.get("dmin") or "",
         dmax=request.args.get("dmax") or "",
-        Person=Person,
     )
 
 @app.route("/families/new", methods=["GET","POST"])
@@ -665,7 +2431,13 @@ def families_edit(fid):
 
 @app.route("/families/<int:fid>/depart", methods=["GET","POST"])
 def families_depart(fid):
-    fam = Family.query.get_or_404(fid)
+    fam = db.session.get(Family, fid)
+    if fam is None:
+        archived = db.session.get(ArchivedFamily, fid) or abort(404)
+        if request.method != "POST":
+            return render_template("family_depart.html", family=archived)
+        # Modifier le départ d'une famille archivée la ramène dans les tables actives
+        fam = unarchive_family(archived)
     if request.method == "POST":
         fam.departure_date = parse_date(request.form.get("departure_date"))
         db.session.commit()
@@ -679,25 +2451,255 @@ def families_delete(fid):
     db.session.commit()
     return redirect(url_for("families_list"))
 
+# ----- Opérations groupées -----
+
+# Départ, changement de chambres ou suppression de plusieurs familles en une
+# transaction. Les écritures sont ensemblistes (UPDATE / DELETE) ; les compteurs
+# et journaux suivent par les triggers SQLite. Seules les familles présentes
+# sont modifiées.
+
+def selected_families(ids: list[int]) -> list[Family]:
+    return (
+        Family.query.filter(Family.id.in_(ids), Family.departure_date.is_(None))
+        .order_by(Family.id.asc()).all()
+    ) if ids else []
+
+
+def family_sizes(ids: list[int]) -> dict[int, int]:
+    sizes = {}
+    for start in range(0, len(ids), 500):
+        sizes.update(db.session.execute(
+            db.select(Person.family_id, func.count())
+            .where(Person.family_id.in_(ids[start:start + 500])).group_by(Person.family_id)
+        ).all())
+    return sizes
+
+
+def validate_room_moves(moves: dict[int, dict], sizes: dict[int, int]) -> list[str]:
+    """Vérifie les nouvelles chambres avant toute écriture : chambres connues,
+    libres (hors familles déplacées), non attribuées deux fois et de capacité suffisante.
+
+    Les numéros sont normalisés (clean_field) sur place : bulk_move écrit ceux validés.
+    """
+    for move in moves.values():
+        move["rooms"] = [r for r in map(clean_field, move["rooms"]) if r]
+        move["current"] = [r for r in map(clean_field, move["current"]) if r]
+    index = room_index()
+    known = set(index["rooms"])
+    capacity = index["capacity"]
+    occupied = occupied_rooms() - {r for fid in moves for r in moves[fid]["current"]}
+    errors = []
+    taken: dict[str, int] = {}
+    for fid, move in moves.items():
+        rooms = move["rooms"]
+        if not rooms:
+            errors.append(f"Famille #{fid} : aucune chambre indiquée")
+            continue
+        if len(set(rooms)) != len(rooms):
+            errors.append(f"Famille #{fid} : la même chambre est indiquée deux fois")
+        for r in rooms:
+            if known and r not in known:
+                errors.append(f"Famille #{fid} : chambre {r} inconnue")
+            elif r in occupied:
+                errors.append(f"Famille #{fid} : chambre {r} déjà occupée")
+            elif r in taken and taken[r] != fid:
+                errors.append(f"Famille #{fid} : chambre {r} déjà attribuée à la famille #{taken[r]}")
+            taken.setdefault(r, fid)
+        per_room = math.ceil(sizes.get(fid, 0) / len(rooms))
+        for r in rooms:
+            cap = capacity.get(r, 0)
+            if cap and per_room > cap:
+                errors.append(f"Famille #{fid} : {per_room} personne(s) pour la chambre {r} (capacité {cap})")
+    return errors
+
+
+def bulk_depart(ids: list[int], departure: date) -> None:
+    db.session.execute(
+        db.update(Family).where(Family.id.in_(ids), Family.departure_date.is_(None))
+        .values(departure_date=departure)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bulk_move(moves: dict[int, dict]) -> None:
+    rooms = {fid: move["rooms"] + [None] * (2 - len(move["rooms"])) for fid, move in moves.items()}
+    db.session.execute(
+        db.update(Family).where(Family.id.in_(list(moves)), Family.departure_date.is_(None))
+        .values(
+            room_number=case({fid: r[0] for fid, r in rooms.items()}, value=Family.id),
+            room_number2=case({fid: r[1] for fid, r in rooms.items()}, value=Family.id),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bulk_delete(ids: list[int]) -> None:
+    db.session.execute(db.delete(Person).where(Person.family_id.in_(ids)).execution_options(synchronize_session=False))
+    db.session.execute(db.delete(Family).where(Family.id.in_(ids)).execution_options(synchronize_session=False))
+
+
+@app.route("/families/bulk", methods=["GET", "POST"])
+def families_bulk():
+    ids = [int(v) for v in request.values.getlist("fid") if v.isdigit()]
+    families = selected_families(ids)
+    if not families:
+        return redirect(url_for("families_list"))
+    ids = [f.id for f in families]
+    sizes = family_sizes(ids)
+    errors: list[str] = []
+    if request.method == "POST":
+        action = request.form.get("action")
+        if action == "depart":
+            departure = parse_date(request.form.get("departure_date"))
+            if departure is None:
+                errors.append("Date de départ manquante ou invalide")
+            else:
+                bulk_depart(ids, departure)
+        elif action == "move":
+            moves = {
+                f.id: {
+                    "current": [r for r in (clean_field(f.room_number), clean_field(f.room_number2)) if r],
+                    "rooms": [r for r in (clean_field(request.form.get(f"room_number-{f.id}")),
+                                          clean_field(request.form.get(f"room_number2-{f.id}"))) if r],
+                }
+                for f in families
+            }
+            moves = {fid: m for fid, m in moves.items() if m["rooms"] != m["current"]}
+            errors = validate_room_moves(moves, sizes)
+            if not errors and moves:
+                bulk_move(moves)
+        elif action == "delete" and request.form.get("confirm") == "yes":
+            bulk_delete(ids)
+        else:
+            errors.append("Action inconnue ou non confirmée")
+        if not errors:
+            db.session.commit()
+            return redirect(url_for("families_list"))
+        db.session.rollback()
+    return render_template(
+        "families_bulk.html", families=families, sizes=sizes, errors=errors, form=request.form, today=date.today()
+    ), 400 if errors else 200
+
+
+# ----- Suggestion de chambres -----
+
+# Les structures de chambres (capacités, voisinages) ne dépendent que de la
+# configuration : elles sont calculées une fois par version de config.json.
+# Deux chambres sont voisines si elles se touchent sur un même plan d'étage ;
+# sans plan, on retient les numéros consécutifs.
+_room_index_cache: dict = {}
+
+
+def room_adjacency(cfg: dict, rooms: list[str]) -> dict[str, set[str]]:
+    known = set(rooms)
+    adjacent: dict[str, set[str]] = {r: set() for r in rooms}
+    layout = cfg.get("layout", {})
+    floors = floor_layouts(cfg)
+    if floors:
+        step_x = int(layout.get("cell_width") or 80) + int(layout.get("col_gap") or 0)
+        step_y = int(layout.get("cell_height") or 40) + int(layout.get("row_gap") or 0)
+        for floor in floors:
+            # Indexation par ligne et par colonne : chaque chambre n'est comparée qu'à ses voisines
+            placed = [r for r in floor.get("rooms", []) if r.get("type", "room") == "room" and r["label"] in known]
+            for axis, step in (("x", step_x), ("y", step_y)):
+                other = "y" if axis == "x" else "x"
+                lines: dict[int, list[dict]] = {}
+                for r in placed:
+                    lines.setdefault(r[other], []).append(r)
+                for line in lines.values():
+                    line.sort(key=lambda r: r[axis])
+                    for a, b in zip(line, line[1:]):
+                        if 0 < b[axis] - a[axis] <= step:
+                            adjacent[a["label"]].add(b["label"])
+                            adjacent[b["label"]].add(a["label"])
+    else:
+        for r in rooms:
+            if r.isdigit() and str(int(r) + 1) in known:
+                adjacent[r].add(str(int(r) + 1))
+                adjacent[str(int(r) + 1)].add(r)
+    return adjacent
+
+
+def room_sort_key(room: str) -> tuple:
+    return (0, int(room), "") if room.isdigit() else (1, 0, room)
+
+
+def room_index() -> dict:
+    version = config_version()
+    if _room_index_cache.get("version") != version:
+        cfg = load_config()
+        rooms = generate_rooms(cfg)
+        adjacency = room_adjacency(cfg, rooms)
+        _room_index_cache.update(
+            version=version,
+            rooms=rooms,
+            capacity={r: room_capacity(r, cfg) for r in rooms},
+            pairs=sorted({tuple(sorted((a, b), key=room_sort_key)) for a, ns in adjacency.items() for b in ns}),
+        )
+    return _room_index_cache
+
+
+def occupied_rooms(exclude_family: int | None = None) -> set[str]:
+    q = db.select(Family.room_number, Family.room_number2).where(Family.departure_date.is_(None))
+    if exclude_family is not None:
+        q = q.where(Family.id != exclude_family)
+    return {clean_field(r) for row in db.session.execute(q) for r in row if clean_field(r)}
+
+
+def suggest_rooms(size: int, adults: int | None = None, exclude_family: int | None = None, limit: int = 5) -> list[dict]:
+    """Meilleures attributions d'une ou deux chambres libres pour ``size`` personnes.
+
+    Une attribution est retenue si elle ne déclenche pas l'alerte de
+    sur-occupation (au plus ``capacité`` personnes par chambre, réparties
+    comme dans l'alerte). Deux chambres ne sont proposées que si elles sont
+    voisines et, quand la composition est connue, s'il y a un adulte par chambre.
+    Les chambres sans capacité configurée sont acceptées mais classées après.
+    """
+    index = room_index()
+    capacity = index["capacity"]
+    occupied = occupied_rooms(exclude_family)
+    free = [r for r in index["rooms"] if r not in occupied]
+    size = max(size, 1)
+    candidates = []
+    for r in free:
+        cap = capacity[r]
+        if cap == 0 or cap >= size:
+            candidates.append((cap == 0, 0, (cap - size) if cap else 0, (r,)))
+    if size > 1 and (adults is None or adults >= 2):
+        per_room = math.ceil(size / 2)
+        for a, b in index["pairs"]:
+            if a in occupied or b in occupied:
+                continue
+            caps = (capacity[a], capacity[b])
+            if all(c == 0 or c >= per_room for c in caps):
+                unknown = 0 in caps
+                candidates.append((unknown, 1, 0 if unknown else sum(caps) - size, (a, b)))
+    candidates.sort(key=lambda c: (c[0], c[2], c[1], [room_sort_key(r) for r in c[3]]))
+    return [
+        {
+            "rooms": list(rooms),
+            "capacity": sum(capacity[r] for r in rooms) if not unknown else None,
+            "spare": spare if not unknown else None,
+        }
+        for unknown, _n, spare, rooms in candidates[:limit]
+    ]
+
+
+@app.route("/api/rooms/suggest")
+def api_rooms_suggest():
+    size = request.args.get("size", type=int) or 1
+    adults = request.args.get("adults", type=int)
+    family = request.args.get("family", type=int)
+    return {"size": size, "suggestions": suggest_rooms(size, adults, family)}
+
 # ----- Personnes -----
 
 @app.route("/persons/<int:fid>")
 def persons_list(fid):
     fam = Family.query.filter_by(id=fid).filter(Family.departure_date.is_(None)).first_or_404()
     today = date.today()
-    rows = []
-    for p in fam.persons.order_by(Person.id.asc()).all():
-        rows.append({
-            "id": p.id,
-            "first_name": p.first_name,
-            "last_name": p.last_name,
-            "dob": p.dob,
-            "sex": p.sex,
-            "phone": p.phone,
-            "age": age_years(p.dob, today),
-            "age_text": age_text(p.dob, today),
-            "age_days": age_days(p.dob, today)
-        })
+    q = db.select(*person_columns(Person, Family)).join(Family).where(Person.family_id == fid).order_by(Person.id.asc())
+    rows = [PersonRow(r, today) for r in db.session.execute(q)]
     return render_template("persons.html", family=fam, persons=rows)
 
 @app.route("/persons/<int:fid>/new", methods=["GET","POST"])
@@ -750,29 +2752,403 @@ def person_detail(pid):
         rooms_text=rooms_text,
     )
 
+# ----- Doublons -----
+
+# Détection des personnes saisies plusieurs fois (familles actives et archives).
+# Plutôt que de comparer toutes les paires, chaque personne est rangée dans
+# quelques blocs (phonétique du nom, date de naissance, téléphone) et seules
+# les personnes d'un même bloc sont comparées puis notées.
+DUPLICATE_MAX_BLOCK = 300     # blocs plus grands ignorés (noms très courants sans autre indice)
+DUPLICATE_MIN_SCORE = 0.8
+SOUNDEX_CODES = {c: d for d, letters in enumerate(("aehiouwy", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r")) for c in letters}
+_duplicate_cache: dict = {}
+
+
+def normalize_name(s: str | None) -> str:
+    s = unicodedata.normalize("NFKD", s or "")
+    return "".join(c for c in s.lower() if "a" <= c <= "z")
+
+
+def soundex(s: str) -> str:
+    """Code phonétique Soundex d'un nom déjà normalisé."""
+    if not s:
+        return ""
+    out, last = s[0], SOUNDEX_CODES.get(s[0])
+    for c in s[1:]:
+        code = SOUNDEX_CODES.get(c)
+        if code and code != last:
+            out += str(code)
+        if c not in "hw":
+            last = code
+    return (out + "000")[:4]
+
+
+def phone_digits(s: str | None) -> str:
+    digits = "".join(c for c in s or "" if c.isdigit())
+    return digits[-9:] if len(digits) >= 8 else ""
+
+
+def duplicate_blocking_keys(first: str, last: str, dob: date | None, phone: str) -> list[tuple]:
+    sf, sl = soundex(first), soundex(last)
+    keys = [("name",) + tuple(sorted((sf, sl)))]
+    if dob:
+        keys += [("dob", dob, sf), ("dob", dob, sl)]
+    if phone:
+        keys.append(("phone", phone))
+    return keys
+
+
+def dob_similarity(a: date | None, b: date | None) -> float:
+    if a is None or b is None:
+        return 0.5
+    if a == b:
+        return 1.0
+    if (a.year, a.month, a.day) == (b.year, b.day, b.month):
+        return 0.8   # jour et mois inversés
+    if a.year == b.year and (a.month == b.month or a.day == b.day):
+        return 0.5
+    return 0.0
+
+
+def duplicate_score(a: dict, b: dict) -> float:
+    score = 0.3 * dob_similarity(a["dob"], b["dob"])
+    if a["phone"] and b["phone"]:
+        score += 0.1 if a["phone"] == b["phone"] else 0.0
+    else:
+        score += 0.05
+    if a["sex"] in ("F", "M") and b["sex"] in ("F", "M") and a["sex"] != b["sex"]:
+        return score * 0.5
+    # Comparaison des noms (la partie coûteuse) seulement si le seuil reste atteignable
+    if score + 0.6 < DUPLICATE_MIN_SCORE:
+        return score
+    names_a = a["first"] + " " + a["last"]
+    name = max(
+        SequenceMatcher(None, names_a, b["first"] + " " + b["last"]).ratio(),
+        SequenceMatcher(None, names_a, b["last"] + " " + b["first"]).ratio(),
+    )
+    return score + 0.6 * name
+
+
+def find_duplicates() -> list[tuple[float, int, int]]:
+    """Paires candidates (score, id, id) triées par score décroissant."""
+    persons: dict[int, dict] = {}
+    blocks: dict[tuple, list[int]] = {}
+    with reporting() as rs:
+        for F, P in ARCHIVE_TIERS:
+            rows = rs.execute(db.select(P.id, P.family_id, P.first_name, P.last_name, P.dob, P.sex, P.phone))
+            for pid, fid, first, last, dob, sex, phone in rows:
+                rec = {
+                    "family_id": fid, "first": normalize_name(first), "last": normalize_name(last),
+                    "dob": dob, "sex": sex, "phone": phone_digits(phone),
+                }
+                persons[pid] = rec
+                for key in duplicate_blocking_keys(rec["first"], rec["last"], dob, rec["phone"]):
+                    blocks.setdefault(key, []).append(pid)
+    seen = set()
+    pairs = []
+    for ids in blocks.values():
+        if len(ids) < 2 or len(ids) > DUPLICATE_MAX_BLOCK:
+            continue
+        for i, a in enumerate(ids):
+            rec_a = persons[a]
+            for b in ids[i + 1:]:
+                pair = (a, b) if a < b else (b, a)
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                rec_b = persons[b]
+                # Les membres d'une même famille partagent nom et téléphone sans être des doublons
+                if rec_a["family_id"] == rec_b["family_id"]:
+                    continue
+                score = duplicate_score(rec_a, rec_b)
+                if score >= DUPLICATE_MIN_SCORE:
+                    pairs.append((score, *pair))
+    pairs.sort(reverse=True)
+    return pairs
+
+
+def cached_duplicates() -> list[tuple[float, int, int]]:
+    version = data_version()[0]
+    if _duplicate_cache.get("version") != version:
+        _duplicate_cache.update(version=version, pairs=find_duplicates())
+    return _duplicate_cache["pairs"]
+
+
+def any_person(pid: int):
+    """Personne active ou archivée (les ids sont uniques entre les deux niveaux)."""
+    return db.session.get(Person, pid) or db.session.get(ArchivedPerson, pid)
+
+
+@app.route("/duplicates")
+def duplicates():
+    dismissed = set(db.session.execute(db.select(DuplicateDismissal.person_a, DuplicateDismissal.person_b)))
+    rows = []
+    for score, a, b in cached_duplicates():
+        if (a, b) in dismissed:
+            continue
+        person_a, person_b = any_person(a), any_person(b)
+        if person_a is None or person_b is None:
+            continue
+        rows.append({"score": round(score * 100), "a": person_a, "b": person_b})
+        if len(rows) >= 200:
+            break
+    return render_template("duplicates.html", rows=rows)
+
+
+@app.route("/duplicates/resolve", methods=["POST"])
+def duplicates_resolve():
+    a, b = request.form.get("a", type=int), request.form.get("b", type=int)
+    if a is None or b is None or a == b:
+        abort(400)
+    a, b = sorted((a, b))
+    persons = {a: any_person(a), b: any_person(b)}
+    if None in persons.values():
+        abort(400)
+    keep_id = request.form.get("keep", type=int)
+    if keep_id is None:
+        if db.session.get(DuplicateDismissal, (a, b)) is None:
+            db.session.add(DuplicateDismissal(person_a=a, person_b=b))
+        db.session.commit()
+        return redirect(url_for("duplicates"))
+    if keep_id not in (a, b):
+        abort(400)
+    keep, drop = persons[keep_id], persons[b if keep_id == a else a]
+    # Fusion : la fiche conservée reprend les informations qui lui manquent
+    for attr in ("dob", "phone"):
+        if getattr(keep, attr) is None:
+            setattr(keep, attr, getattr(drop, attr))
+    if keep.sex in (None, "Autre/NP") and drop.sex in ("F", "M"):
+        keep.sex = drop.sex
+    family = drop.family
+    db.session.delete(drop)
+    db.session.flush()
+    # Famille (active ou archivée) vidée par la fusion : supprimée, elle
+    # occuperait encore ses chambres sans personne
+    if family is not None and family.persons.count() == 0:
+        db.session.delete(family)
+    db.session.commit()
+    return redirect(url_for("duplicates"))
+
 # ----- Résidents -----
 
 @app.route("/residents")
+@conditional
 def residents_list():
     today = date.today()
-    rows = []
-    for p in Person.query.join(Family).filter(Family.departure_date.is_(None)).all():
-        fam = p.family
-        rows.append({
-            "id": p.id,
-            "first_name": p.first_name,
-            "last_name": p.last_name,
-            "sex": p.sex,
-            "age": age_years(p.dob, today),
-            "age_text": age_text(p.dob, today),
-            "age_days": age_days(p.dob, today),
-            "family_label": fam.label,
-            "room_number": rooms_text(fam),
-            "arrival_date": fam.arrival_date,
-            "phone": p.phone,
-        })
+    q = db.select(*person_columns(Person, Family)).join(Family).where(Family.departure_date.is_(None))
+    rows = [PersonRow(r, today) for r in db.session.execute(q)]
     return render_template("residents.html", persons=rows)
 
+# ----- Recherche instantanée -----
+
+# Index des préfixes en mémoire (liste triée + bisect) sur les noms des
+# personnes présentes, les labels et les chambres des familles. Il est
+# construit une fois par processus puis tenu à jour en rejouant change_log :
+# tout de suite après une écriture du processus, au plus toutes les
+# LOOKUP_REFRESH_SECONDS secondes pour celles des autres processus. Une
+# frappe ne lit donc la base que si quelque chose a changé.
+LOOKUP_REFRESH_SECONDS = 2
+LOOKUP_MAX_REPLAY = 5000
+LOOKUP_SCAN = 200
+_lookup_lock = threading.Lock()
+
+
+def lookup_tokens(*values: str | None) -> list[str]:
+    tokens = []
+    for value in values:
+        value = unicodedata.normalize("NFKD", value or "").lower()
+        tokens += [t for t in re.split(r"[^a-z0-9]+", value.encode("ascii", "ignore").decode()) if t]
+    return tokens
+
+
+class PrefixIndex:
+    """Clés normalisées triées -> (type, id), avec les fiches affichées en suggestion."""
+
+    def __init__(self):
+        self.entries: list[tuple[str, str, int]] = []
+        self.keys: dict[tuple[str, int], list[str]] = {}
+        self.families: dict[int, dict] = {}
+        self.persons: dict[int, dict] = {}
+        self.members: dict[int, set[int]] = {}
+        self.seq = 0
+        self.built = False
+        self.checked = 0.0
+        self.stale = True
+
+    def _index(self, kind: str, oid: int, tokens: list[str]) -> None:
+        self._unindex(kind, oid)
+        tokens = sorted(set(tokens))
+        for t in tokens:
+            bisect.insort(self.entries, (t, kind, oid))
+        self.keys[(kind, oid)] = tokens
+
+    def _unindex(self, kind: str, oid: int) -> None:
+        for t in self.keys.pop((kind, oid), ()):
+            i = bisect.bisect_left(self.entries, (t, kind, oid))
+            if i < len(self.entries) and self.entries[i] == (t, kind, oid):
+                del self.entries[i]
+
+    def put_family(self, row: dict) -> None:
+        fid = row["id"]
+        if row.get("departure_date"):
+            self.drop_family(fid)
+            return
+        returning = fid not in self.families
+        self.families[fid] = {k: row.get(k) for k in ("label", "room_number", "room_number2")}
+        self._index("family", fid, lookup_tokens(row.get("label"), row.get("room_number"), row.get("room_number2")))
+        if returning:
+            # Famille de retour (ou arrivée avant ses membres) : ses membres sont relus
+            for p in db.session.execute(
+                db.select(Person.id, Person.family_id, Person.first_name, Person.last_name).where(Person.family_id == fid)
+            ).mappings():
+                self.put_person(dict(p))
+
+    def drop_family(self, fid: int) -> None:
+        self.families.pop(fid, None)
+        self._unindex("family", fid)
+        for pid in list(self.members.get(fid, ())):
+            self.drop_person(pid)
+
+    def put_person(self, row: dict) -> None:
+        pid = row["id"]
+        self.drop_person(pid)
+        if row.get("family_id") not in self.families:
+            return
+        self.persons[pid] = {k: row.get(k) for k in ("first_name", "last_name", "family_id")}
+        self.members.setdefault(row["family_id"], set()).add(pid)
+        self._index("person", pid, lookup_tokens(row.get("first_name"), row.get("last_name")))
+
+    def drop_person(self, pid: int) -> None:
+        person = self.persons.pop(pid, None)
+        if person is not None:
+            self.members.get(person["family_id"], set()).discard(pid)
+        self._unindex("person", pid)
+
+    def search(self, query: str, kinds: set[str], limit: int) -> list[tuple[str, int]]:
+        tokens = lookup_tokens(query)
+        if not tokens:
+            return []
+        # Candidats : préfixe du mot le plus long, puis tous les mots doivent correspondre
+        first = max(tokens, key=len)
+        found: dict[tuple[str, int], int] = {}
+        i = bisect.bisect_left(self.entries, (first,))
+        while i < len(self.entries) and self.entries[i][0].startswith(first) and len(found) < LOOKUP_SCAN:
+            key, kind, oid = self.entries[i]
+            if kind in kinds and (kind, oid) not in found:
+                found[(kind, oid)] = 0
+            i += 1
+        ranked = []
+        for kind, oid in found:
+            keys = self.keys[(kind, oid)]
+            if not all(any(k.startswith(t) for k in keys) for t in tokens):
+                continue
+            exact = sum(t in keys for t in tokens)
+            ranked.append((-exact, kind != "family", self.label(kind, oid).lower(), kind, oid))
+        ranked.sort()
+        return [(kind, oid) for *_rank, kind, oid in ranked[:limit]]
+
+    def label(self, kind: str, oid: int) -> str:
+        if kind == "family":
+            return self.families[oid]["label"] or f"Famille {oid}"
+        p = self.persons[oid]
+        return f"{p['first_name']} {p['last_name']}"
+
+    def rooms(self, fid: int) -> str:
+        f = self.families.get(fid, {})
+        return " & ".join(r for r in (clean_field(f.get("room_number")), clean_field(f.get("room_number2"))) if r)
+
+
+_lookup_index = PrefixIndex()
+
+
+@event.listens_for(db.session, "after_commit")
+def mark_lookup_stale(_session):
+    _lookup_index.stale = True
+
+
+def rebuild_lookup_index() -> PrefixIndex:
+    index = PrefixIndex()
+    index.built = True
+    last = db.session.execute(db.select(func.coalesce(func.max(ChangeLog.seq), 0))).scalar()
+    index.seq = max(last, change_log_horizon())
+    for f in db.session.execute(
+        db.select(Family.id, Family.label, Family.room_number, Family.room_number2).where(Family.departure_date.is_(None))
+    ).mappings():
+        index.families[f["id"]] = {k: f[k] for k in ("label", "room_number", "room_number2")}
+        index.keys[("family", f["id"])] = sorted(set(lookup_tokens(f["label"], f["room_number"], f["room_number2"])))
+    for p in db.session.execute(
+        db.select(Person.id, Person.family_id, Person.first_name, Person.last_name)
+        .join(Family).where(Family.departure_date.is_(None))
+    ).mappings():
+        if p["family_id"] not in index.families:
+            continue
+        index.persons[p["id"]] = {k: p[k] for k in ("first_name", "last_name", "family_id")}
+        index.members.setdefault(p["family_id"], set()).add(p["id"])
+        index.keys[("person", p["id"])] = sorted(set(lookup_tokens(p["first_name"], p["last_name"])))
+    # Un seul tri pour la construction ; insort (_index) sert au rejeu incrémental
+    index.entries = sorted((t, kind, oid) for (kind, oid), tokens in index.keys.items() for t in tokens)
+    return index
+
+
+def lookup_index() -> PrefixIndex:
+    """Index à jour : rejoue les entrées de change_log postérieures à sa construction."""
+    global _lookup_index
+    index = _lookup_index
+    if not index.stale and monotonic() - index.checked < LOOKUP_REFRESH_SECONDS:
+        return index
+    with _lookup_lock:
+        index = _lookup_index
+        index.stale, index.checked = False, monotonic()
+        changes = db.session.execute(
+            db.select(ChangeLog.seq, ChangeLog.table_name, ChangeLog.op, ChangeLog.data)
+            .where(ChangeLog.seq > index.seq).order_by(ChangeLog.seq).limit(LOOKUP_MAX_REPLAY + 1)
+        ).all()
+        if not index.built or len(changes) > LOOKUP_MAX_REPLAY or change_log_horizon() > index.seq:
+            _lookup_index = index = rebuild_lookup_index()
+            index.checked = monotonic()
+            return index
+        for seq, table_name, op, data in changes:
+            row = json.loads(data)
+            removed = op in ("delete", "archive")
+            if table_name == "family":
+                if removed:
+                    index.drop_family(row["id"])
+                else:
+                    index.put_family(row)
+            elif table_name == "person":
+                if removed:
+                    index.drop_person(row["id"])
+                else:
+                    index.put_person(row)
+            index.seq = seq
+    return index
+
+
+@app.route("/api/lookup")
+def api_lookup():
+    q = request.args.get("q", "")
+    kinds = set(request.args.getlist("kind")) & {"family", "person"} or {"family", "person"}
+    limit = min(request.args.get("limit", 8, type=int), 50)
+    index = lookup_index()
+    results = []
+    with _lookup_lock:
+        for kind, oid in index.search(q, kinds, limit):
+            if kind == "family":
+                results.append({
+                    "kind": kind, "id": oid, "label": index.label(kind, oid),
+                    "detail": f"ch. {index.rooms(oid)}" if index.rooms(oid) else "",
+                    "url": url_for("persons_list", fid=oid),
+                })
+            else:
+                fid = index.persons[oid]["family_id"]
+                detail = index.label("family", fid) + (f" · ch. {index.rooms(fid)}" if index.rooms(fid) else "")
+                results.append({
+                    "kind": kind, "id": oid, "label": index.label(kind, oid), "detail": detail,
+                    "url": url_for("person_detail", pid=oid),
+                })
+    return {"q": q, "results": results}
+
+
 # ----- Recherches -----
 
 @app.route("/search")
@@ -792,49 +3168,36 @@ def search():
 
     families = []
     if any([fam_label, fam_room, fam_arrival, fam_dmin, fam_dmax]):
-        qf = Family.query.filter(Family.departure_date.is_(None))
+        qf = db.select(*family_columns(Family)).where(Family.departure_date.is_(None))
         if fam_label:
-            qf = qf.filter(Family.label.like(f"%{fam_label}%"))
+            qf = qf.where(Family.label.like(f"%{fam_label}%"))
         if fam_room:
-            qf = qf.filter(or_(Family.room_number.like(f"%{fam_room}%"), Family.room_number2.like(f"%{fam_room}%")))
+            qf = qf.where(or_(Family.room_number.like(f"%{fam_room}%"), Family.room_number2.like(f"%{fam_room}%")))
         if fam_arrival:
-            qf = qf.filter(Family.arrival_date == fam_arrival)
+            qf = qf.where(Family.arrival_date == fam_arrival)
         if fam_dmin:
-            qf = qf.filter(Family.arrival_date >= fam_dmin)
+            qf = qf.where(Family.arrival_date >= fam_dmin)
         if fam_dmax:
-            qf = qf.filter(Family.arrival_date <= fam_dmax)
-        families = qf.order_by(Family.arrival_date.desc().nullslast()).all()
+            qf = qf.where(Family.arrival_date <= fam_dmax)
+        families = [FamilyRow(r) for r in db.session.execute(qf.order_by(Family.arrival_date.desc().nullslast()))]
 
     persons = []
     if any([p_last, p_first, p_dob, p_arrival, p_room, p_phone]):
-        qp = Person.query.join(Family).filter(Family.departure_date.is_(None))
+        qp = db.select(*person_columns(Person, Family)).join(Family).where(Family.departure_date.is_(None))
         if p_last:
-            qp = qp.filter(Person.last_name.like(f"%{p_last}%"))
+            qp = qp.where(Person.last_name.like(f"%{p_last}%"))
         if p_first:
-            qp = qp.filter(Person.first_name.like(f"%{p_first}%"))
+            qp = qp.where(Person.first_name.like(f"%{p_first}%"))
         if p_dob:
-            qp = qp.filter(Person.dob == p_dob)
+            qp = qp.where(Person.dob == p_dob)
         if p_arrival:
-            qp = qp.filter(Family.arrival_date == p_arrival)
+            qp = qp.where(Family.arrival_date == p_arrival)
         if p_room:
-            qp = qp.filter(or_(Family.room_number.like(f"%{p_room}%"), Family.room_number2.like(f"%{p_room}%")))
+            qp = qp.where(or_(Family.room_number.like(f"%{p_room}%"), Family.room_number2.like(f"%{p_room}%")))
         if p_phone:
-            qp = qp.filter(Person.phone.like(f"%{p_phone}%"))
+            qp = qp.where(Person.phone.like(f"%{p_phone}%"))
         today = date.today()
-        persons = [
-            {
-                "id": p.id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "age": age_years(p.dob, today),
-                "age_text": age_text(p.dob, today),
-                "age_days": age_days(p.dob, today),
-                "room_number": rooms_text(p.family),
-                "arrival_date": p.family.arrival_date,
-                "phone": p.phone,
-            }
-            for p in qp.all()
-        ]
+        persons = [PersonRow(r, today) for r in db.session.execute(qp)]
 
     return render_template(
         "search.html",
@@ -868,133 +3231,575 @@ def archive():
     p_room = (request.args.get("p_room") or "").strip()
     p_phone = (request.args.get("p_phone") or "").strip()
 
-    families = []
-    if any([fam_label, fam_room, fam_arrival, fam_dmin, fam_dmax]):
-        qf = Family.query.filter(Family.departure_date.isnot(None))
-        if fam_label:
-            qf = qf.filter(Family.label.like(f"%{fam_label}%"))
-        if fam_room:
-            qf = qf.filter(or_(Family.room_number.like(f"%{fam_room}%"), Family.room_number2.like(f"%{fam_room}%")))
-        if fam_arrival:
-            qf = qf.filter(Family.arrival_date == fam_arrival)
-        if fam_dmin:
-            qf = qf.filter(Family.arrival_date >= fam_dmin)
-        if fam_dmax:
-            qf = qf.filter(Family.arrival_date <= fam_dmax)
-        families = qf.order_by(Family.arrival_date.desc().nullslast()).all()
+    # Les familles parties récemment sont encore dans les tables principales,
+    # les plus anciennes dans la base d'archives : on interroge les deux.
+    with reporting() as rs:
+        families = []
+        if any([fam_label, fam_room, fam_arrival, fam_dmin, fam_dmax]):
+            for F, _P in ARCHIVE_TIERS:
+                qf = db.select(*family_columns(F)).where(F.departure_date.isnot(None))
+                if fam_label:
+                    qf = qf.where(F.label.like(f"%{fam_label}%"))
+                if fam_room:
+                    qf = qf.where(or_(F.room_number.like(f"%{fam_room}%"), F.room_number2.like(f"%{fam_room}%")))
+                if fam_arrival:
+                    qf = qf.where(F.arrival_date == fam_arrival)
+                if fam_dmin:
+                    qf = qf.where(F.arrival_date >= fam_dmin)
+                if fam_dmax:
+                    qf = qf.where(F.arrival_date <= fam_dmax)
+                families.extend(FamilyRow(r) for r in rs.execute(qf))
+            families.sort(key=lambda f: (f.arrival_date is None, -(f.arrival_date or date.min).toordinal()))
 
-    persons = []
-    if any([p_last, p_first, p_dob, p_arrival, p_room, p_phone]):
-        qp = Person.query.join(Family).filter(Family.departure_date.isnot(None))
-        if p_last:
-            qp = qp.filter(Person.last_name.like(f"%{p_last}%"))
-        if p_first:
-            qp = qp.filter(Person.first_name.like(f"%{p_first}%"))
-        if p_dob:
-            qp = qp.filter(Person.dob == p_dob)
-        if p_arrival:
-            qp = qp.filter(Family.arrival_date == p_arrival)
-        if p_room:
-            qp = qp.filter(or_(Family.room_number.like(f"%{p_room}%"), Family.room_number2.like(f"%{p_room}%")))
-        if p_phone:
-            qp = qp.filter(Person.phone.like(f"%{p_phone}%"))
-        today = date.today()
-        persons = [
-            {
-                "id": p.id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "age": age_years(p.dob, today),
-                "age_text": age_text(p.dob, today),
-                "age_days": age_days(p.dob, today),
-                "room_number": rooms_text(p.family),
-                "arrival_date": p.family.arrival_date,
-                "phone": p.phone,
-            }
-            for p in qp.all()
-        ]
+        persons = []
+        if any([p_last, p_first, p_dob, p_arrival, p_room, p_phone]):
+            today = date.today()
+            for F, P in ARCHIVE_TIERS:
+                qp = db.select(*person_columns(P, F)).join(F, P.family_id == F.id).where(F.departure_date.isnot(None))
+                if p_last:
+                    qp = qp.where(P.last_name.like(f"%{p_last}%"))
+                if p_first:
+                    qp = qp.where(P.first_name.like(f"%{p_first}%"))
+                if p_dob:
+                    qp = qp.where(P.dob == p_dob)
+                if p_arrival:
+                    qp = qp.where(F.arrival_date == p_arrival)
+                if p_room:
+                    qp = qp.where(or_(F.room_number.like(f"%{p_room}%"), F.room_number2.like(f"%{p_room}%")))
+                if p_phone:
+                    qp = qp.where(P.phone.like(f"%{p_phone}%"))
+                persons.extend(PersonRow(r, today) for r in rs.execute(qp))
 
-    return render_template(
-        "archive.html",
-        families=families,
-        persons=persons,
-        fam_label=fam_label,
-        fam_room=fam_room,
-        fam_arrival=request.args.get("fam_arrival") or "",
-        fam_dmin=request.args.get("fam_dmin") or "",
-        fam_dmax=request.args.get("fam_dmax") or "",
-        p_last=p_last,
-        p_first=p_first,
-        p_dob=request.args.get("p_dob") or "",
-        p_arrival=request.args.get("p_arrival") or "",
-        p_room=p_room,
-        p_phone=p_phone,
-    )
+        return render_template(
+            "archive.html",
+            families=families,
+            persons=persons,
+            fam_label=fam_label,
+            fam_room=fam_room,
+            fam_arrival=request.args.get("fam_arrival") or "",
+            fam_dmin=request.args.get("fam_dmin") or "",
+            fam_dmax=request.args.get("fam_dmax") or "",
+            p_last=p_last,
+            p_first=p_first,
+            p_dob=request.args.get("p_dob") or "",
+            p_arrival=request.args.get("p_arrival") or "",
+            p_room=p_room,
+            p_phone=p_phone,
+        )
 
 # ----- Export CSV -----
 
 @app.route("/export/families.csv")
+@conditional
 def export_families_csv():
     out = StringIO()
     w = csv.writer(out, dialect="excel")
     w.writerow(["id","label","room_number","arrival_date","num_persons"])
-    for f in Family.query.filter(Family.departure_date.is_(None)).order_by(Family.id.asc()).all():
-        w.writerow([f.id, f.label or "", rooms_text(f) or "", f.arrival_date or "", f.persons.count()])
+    # Une seule requête : effectifs comptés par GROUP BY (pas de count() par famille)
+    sizes = db.select(Person.family_id, func.count().label("n")).group_by(Person.family_id).subquery()
+    q = (
+        db.select(*family_columns(Family), func.coalesce(sizes.c.n, 0))
+        .outerjoin(sizes, sizes.c.family_id == Family.id)
+        .where(Family.departure_date.is_(None)).order_by(Family.id.asc())
+    )
+    with reporting() as rs:
+        for *row, size in rs.execute(q):
+            f = FamilyRow(row)
+            w.writerow([f.id, f.label or "", rooms_text(f) or "", f.arrival_date or "", size])
     resp = make_response(out.getvalue().encode("utf-8-sig"))
     resp.headers["Content-Type"] = "text/csv; charset=utf-8"
     resp.headers["Content-Disposition"] = "attachment; filename=families.csv"
     return resp
 
 @app.route("/export/persons.csv")
+@conditional
 def export_persons_csv():
     out = StringIO()
     w = csv.writer(out, dialect="excel")
     w.writerow(["id","family_id","family_label","room_number","last_name","first_name","dob","sex","age"])
     today = date.today()
-    for p in Person.query.join(Family).filter(Family.departure_date.is_(None)).order_by(Person.id.asc()).all():
-        fam = p.family
-        w.writerow([p.id, fam.id, fam.label or "", rooms_text(fam) or "", p.last_name, p.first_name, p.dob or "", p.sex or "", age_years(p.dob, today) or ""])
+    q = db.select(*person_columns(Person, Family)).join(Family).where(Family.departure_date.is_(None)).order_by(Person.id.asc())
+    with reporting() as rs:
+        for p in (PersonRow(r, today) for r in rs.execute(q)):
+            w.writerow([p.id, p.family_id, p.family_label or "", p.room_number or "", p.last_name, p.first_name, p.dob or "", p.sex or "", p.age or ""])
     resp = make_response(out.getvalue().encode("utf-8-sig"))
     resp.headers["Content-Type"] = "text/csv; charset=utf-8"
     resp.headers["Content-Disposition"] = "attachment; filename=persons.csv"
     return resp
 
+# ----- Export analytique (format colonnes) -----
+
+# Historique complet (familles et personnes, actives et archivées) avec des
+# faits dérivés par séjour. Parquet si pyarrow est installé, sinon une base
+# SQLite compressée (gzip) aux colonnes typées : les dates y sont des entiers
+# (jours depuis le 1970-01-01, comme le type date32 de Parquet), décrits dans
+# sa table columns_info. Les lignes sont lues par tranches, sur l'instantané de
+# lecture, pour rester léger sur de gros historiques.
+ANALYTICS_CHUNK = 5000
+ANALYTICS_SCHEMA = {
+    "families": [
+        ("id", "int"), ("label", "str"), ("room_number", "str"), ("room_number2", "str"),
+        ("arrival_date", "date"), ("departure_date", "date"), ("archived", "bool"),
+        ("stay_days", "int"), ("num_rooms", "int"), ("num_persons", "int"),
+    ],
+    "persons": [
+        ("id", "int"), ("family_id", "int"), ("last_name", "str"), ("first_name", "str"),
+        ("dob", "date"), ("sex", "str"), ("archived", "bool"), ("arrival_date", "date"),
+        ("age_at_arrival", "int"),
+    ],
+}
+SQLITE_TYPES = {"int": "INTEGER", "str": "TEXT", "date": "INTEGER", "bool": "INTEGER"}
+SQLITE_ENCODINGS = {
+    "int": "entier",
+    "str": "texte",
+    "date": "jours depuis 1970-01-01 (date32) ; en SQL : date('1970-01-01', col || ' days')",
+    "bool": "0 ou 1",
+}
+ANALYTICS_EPOCH = date(1970, 1, 1)
+
+
+def analytics_chunks(rs, table: str, today: date):
+    """Produit les lignes de ``table`` par tranches de ANALYTICS_CHUNK (pagination par id)."""
+    for archived, (F, P) in enumerate(ARCHIVE_TIERS):
+        last_id = 0
+        while True:
+            if table == "families":
+                size = db.select(func.count()).where(P.family_id == F.id).scalar_subquery()
+                q = db.select(F, size).where(F.id > last_id).order_by(F.id).limit(ANALYTICS_CHUNK)
+                rows = [
+                    {
+                        "id": f.id, "label": f.label, "room_number": f.room_number, "room_number2": f.room_number2,
+                        "arrival_date": f.arrival_date, "departure_date": f.departure_date,
+                        "archived": bool(archived),
+                        "stay_days": ((f.departure_date or today) - f.arrival_date).days if f.arrival_date else None,
+                        "num_rooms": sum(1 for r in (f.room_number, f.room_number2) if clean_field(r)),
+                        "num_persons": n,
+                    }
+                    for f, n in rs.execute(q)
+                ]
+            else:
+                q = (
+                    db.select(P, F.arrival_date).join(F, P.family_id == F.id)
+                    .where(P.id > last_id).order_by(P.id).limit(ANALYTICS_CHUNK)
+                )
+                rows = [
+                    {
+                        "id": p.id, "family_id": p.family_id, "last_name": p.last_name, "first_name": p.first_name,
+                        "dob": p.dob, "sex": p.sex, "archived": bool(archived), "arrival_date": arrival,
+                        "age_at_arrival": age_years(p.dob, arrival) if arrival and p.dob and p.dob <= arrival else None,
+                    }
+                    for p, arrival in rs.execute(q)
+                ]
+            if not rows:
+                break
+            yield rows
+            last_id = rows[-1]["id"]
+            rs.expunge_all()
+
+
+def write_analytics_parquet(out_path: str, today: date) -> None:
+    """Archive zip contenant un fichier Parquet (zstd) par table."""
+    types = {"int": pa.int64(), "str": pa.string(), "date": pa.date32(), "bool": pa.bool_()}
+    with reporting() as rs, zipfile.ZipFile(out_path, "w", zipfile.ZIP_STORED) as zf:
+        for table, columns in ANALYTICS_SCHEMA.items():
+            schema = pa.schema([(name, types[t]) for name, t in columns])
+            buf = BytesIO()
+            with pq.ParquetWriter(buf, schema, compression="zstd") as writer:
+                for rows in analytics_chunks(rs, table, today):
+                    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            zf.writestr(f"{table}.parquet", buf.getvalue())
+
+
+def write_analytics_sqlite(out_path: str, today: date) -> None:
+    """Base SQLite compressée en gzip ; dates en jours depuis ANALYTICS_EPOCH (voir columns_info)."""
+    fd, tmp = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    try:
+        out = sqlite3.connect(tmp)
+        out.execute("CREATE TABLE columns_info (table_name TEXT, column_name TEXT, type TEXT, encoding TEXT)")
+        out.executemany("INSERT INTO columns_info VALUES (?, ?, ?, ?)", (
+            (table, name, t, SQLITE_ENCODINGS[t]) for table, columns in ANALYTICS_SCHEMA.items() for name, t in columns
+        ))
+        with reporting() as rs:
+            for table, columns in ANALYTICS_SCHEMA.items():
+                names = [name for name, _t in columns]
+                out.execute(f"CREATE TABLE {table} ({', '.join(f'{n} {SQLITE_TYPES[t]}' for n, t in columns)})")
+                sql = f"INSERT INTO {table} VALUES ({', '.join('?' * len(names))})"
+                for rows in analytics_chunks(rs, table, today):
+                    out.executemany(sql, (
+                        [(v - ANALYTICS_EPOCH).days if isinstance(v, date) else v for v in (r[n] for n in names)]
+                        for r in rows
+                    ))
+                    out.commit()
+        out.close()
+        with open(tmp, "rb") as src, gzip.open(out_path, "wb") as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+    finally:
+        os.remove(tmp)
+
+
+def export_analytics(out_path: str, fmt: str | None = None) -> str:
+    """Écrit l'export analytique ; retourne le format utilisé (« parquet » ou « sqlite »)."""
+    fmt = fmt or ("parquet" if pq is not None else "sqlite")
+    if fmt == "parquet" and pq is None:
+        raise RuntimeError("pyarrow n'est pas installé")
+    (write_analytics_parquet if fmt == "parquet" else write_analytics_sqlite)(out_path, date.today())
+    return fmt
+
+
+@app.route("/export/analytics")
+@conditional
+def export_analytics_view():
+    fd, tmp = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        fmt = export_analytics(tmp)
+        with open(tmp, "rb") as fh:
+            payload = fh.read()
+    finally:
+        os.remove(tmp)
+    resp = make_response(payload)
+    if fmt == "parquet":
+        resp.headers["Content-Type"] = "application/zip"
+        resp.headers["Content-Disposition"] = "attachment; filename=analytics.parquet.zip"
+    else:
+        resp.headers["Content-Type"] = "application/gzip"
+        resp.headers["Content-Disposition"] = "attachment; filename=analytics.sqlite.gz"
+    return resp
+
+
+@app.cli.command("export-analytics")
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["parquet", "sqlite"]), help="Par défaut : parquet si pyarrow est installé.")
+def export_analytics_command(path, fmt):
+    """Écrit l'export analytique (format colonnes) de tout l'historique."""
+    try:
+        fmt = export_analytics(path, fmt)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    print(f"Export {fmt} écrit dans {path}")
+
+# ----- Import CSV -----
+
+# Même disposition de colonnes que l'export des personnes. Les colonnes
+# « id » et « age » sont ignorées ; « arrival_date » et « phone » sont
+# acceptées en plus. Une ligne dont « family_id » désigne une famille présente
+# y est rattachée ; sinon les lignes sont regroupées en nouvelles familles par
+# family_id du fichier, ou à défaut par (family_label, room_number).
+IMPORT_BATCH_SIZE = 500
+
+
+def parse_dates(values) -> dict[str, date | None]:
+    """Analyse un lot de dates : chaque valeur distincte n'est traitée qu'une fois,
+    avec un chemin rapide pour les formats AAAA-MM-JJ et JJ/MM/AAAA."""
+    out: dict[str, date | None] = {}
+    for s in set(values):
+        if not s:
+            continue
+        d = None
+        try:
+            if len(s) == 10 and s[4] == "-" and s[7] == "-":
+                d = date(int(s[:4]), int(s[5:7]), int(s[8:]))
+            elif len(s) == 10 and s[2] == "/" and s[5] == "/":
+                d = date(int(s[6:]), int(s[3:5]), int(s[:2]))
+        except ValueError:
+            d = None
+        out[s] = d or parse_date(s)
+    return out
+
+
+def split_rooms(raw: str | None) -> list[str]:
+    return [r.strip() for r in (raw or "").replace("/", "&").split("&") if r.strip()]
+
+
+def read_import_rows(stream):
+    """Lit le CSV par lots de IMPORT_BATCH_SIZE lignes (numéro de ligne, dict)."""
+    text_stream = TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    header = text_stream.readline()
+    delimiter = ";" if header.count(";") > header.count(",") else ","
+    fields = [h.strip().lower() for h in next(csv.reader([header], delimiter=delimiter), [])]
+    batch = []
+    for lineno, row in enumerate(csv.reader(text_stream, delimiter=delimiter), start=2):
+        if not any(v.strip() for v in row):
+            continue
+        padded = row + [""] * (len(fields) - len(row))
+        batch.append((lineno, dict(zip(fields, (v.strip() for v in padded)))))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            yield fields, batch
+            batch = []
+    yield fields, batch
+
+
+def validate_import(stream, cfg: dict) -> dict:
+    """Valide un fichier d'import sans rien écrire.
+
+    Retourne le rapport : nombre de lignes, erreurs par ligne et familles à
+    créer ou compléter (chacune avec ses personnes).
+    """
+    rooms = set(generate_rooms(cfg))
+    active_ids = {r[0] for r in db.session.execute(db.select(Family.id).where(Family.departure_date.is_(None)))}
+    groups: dict[tuple, dict] = {}
+    declared: dict[tuple, dict] = {}
+    errors: list[tuple[int, str]] = []
+    rows = 0
+    for fields, batch in read_import_rows(stream):
+        missing = [c for c in ("last_name", "first_name") if c not in fields]
+        if missing:
+            errors.append((1, f"Colonne(s) manquante(s) : {', '.join(missing)}"))
+            break
+        dates = parse_dates([r.get(k, "") for _n, r in batch for k in ("dob", "arrival_date")])
+        for lineno, r in batch:
+            rows += 1
+            problems = []
+            if not r.get("last_name") or not r.get("first_name"):
+                problems.append("nom et prénom obligatoires")
+            dob = dates.get(r.get("dob", ""))
+            if r.get("dob") and dob is None:
+                problems.append(f"date de naissance invalide « {r['dob']} »")
+            arrival = dates.get(r.get("arrival_date", ""))
+            if r.get("arrival_date") and arrival is None:
+                problems.append(f"date d'arrivée invalide « {r['arrival_date']} »")
+            sex = r.get("sex") or "Autre/NP"
+            if sex not in SEX_CHOICES:
+                problems.append(f"sexe inconnu « {sex} »")
+            fid = r.get("family_id", "")
+            if fid and not fid.isdigit():
+                problems.append(f"family_id invalide « {fid} »")
+            existing = fid.isdigit() and int(fid) in active_ids
+            room_list = split_rooms(r.get("room_number"))
+            if not existing:
+                if len(room_list) > 2:
+                    problems.append("au plus deux chambres par famille")
+                unknown = [x for x in room_list if rooms and x not in rooms]
+                if unknown:
+                    problems.append(f"chambre(s) inconnue(s) : {', '.join(unknown)}")
+                if not fid and not r.get("family_label") and not room_list:
+                    problems.append("famille non identifiée (family_id, family_label ou room_number)")
+            if problems:
+                errors.extend((lineno, p) for p in problems)
+                continue
+            if existing:
+                key = ("existing", int(fid))
+            elif fid:
+                key = ("file", fid)
+            else:
+                key = ("label", r.get("family_label", ""), tuple(room_list))
+            # Valeurs de famille données explicitement par la ligne
+            values = {"label": clean_field(r.get("family_label")), "rooms": tuple(room_list) or None, "arrival": arrival}
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "id": int(fid) if existing else None,
+                    "label": values["label"],
+                    "room_number": room_list[0] if room_list else None,
+                    "room_number2": room_list[1] if len(room_list) > 1 else None,
+                    "arrival_date": arrival or date.today(),
+                    "persons": [],
+                }
+                declared[key] = values | {"line": lineno}
+            elif not existing:
+                # Les lignes suivantes d'une nouvelle famille peuvent compléter
+                # ses informations, pas les contredire
+                first = declared[key]
+                conflicts = [
+                    f"{name} de la ligne {first['line']}"
+                    for field, name in (
+                        ("label", "libellé différent"), ("rooms", "chambres différentes"), ("arrival", "date d'arrivée différente"),
+                    )
+                    if values[field] and first[field] and values[field] != first[field]
+                ]
+                if conflicts:
+                    errors.extend((lineno, f"famille incohérente : {c}") for c in conflicts)
+                    continue
+                for field, value in values.items():
+                    if value and not first[field]:
+                        first[field] = value
+                group.update(
+                    label=first["label"],
+                    room_number=first["rooms"][0] if first["rooms"] else None,
+                    room_number2=first["rooms"][1] if first["rooms"] and len(first["rooms"]) > 1 else None,
+                    arrival_date=first["arrival"] or date.today(),
+                )
+            group["persons"].append({
+                "first_name": r["first_name"],
+                "last_name": r["last_name"],
+                "dob": dob,
+                "sex": sex,
+                "phone": clean_field(r.get("phone")),
+            })
+    families = list(groups.values())
+    return {
+        "rows": rows,
+        "errors": errors,
+        "families": families,
+        "new_families": sum(1 for g in families if g["id"] is None),
+        "persons": sum(len(g["persons"]) for g in families),
+    }
+
+
+def import_families(families: list[dict]) -> None:
+    """Insère les familles validées par transactions d'environ IMPORT_BATCH_SIZE personnes.
+
+    Insertion groupée (sans évènements ORM) : les ids sont donc réservés ici.
+    """
+    chunks, chunk, size = [], [], 0
+    for g in families:
+        chunk.append(g)
+        size += len(g["persons"])
+        if size >= IMPORT_BATCH_SIZE:
+            chunks.append(chunk)
+            chunk, size = [], 0
+    if chunk:
+        chunks.append(chunk)
+    for chunk in chunks:
+        next_fid = allocate_ids(db.session, "family", sum(g["id"] is None for g in chunk))
+        next_pid = allocate_ids(db.session, "person", sum(len(g["persons"]) for g in chunk))
+        fam_rows, person_rows = [], []
+        for g in chunk:
+            fid = g["id"]
+            if fid is None:
+                fid, next_fid = next_fid, next_fid + 1
+                fam_rows.append({k: g[k] for k in ("label", "room_number", "room_number2", "arrival_date")} | {"id": fid})
+            for p in g["persons"]:
+                person_rows.append(p | {"id": next_pid, "family_id": fid})
+                next_pid += 1
+        if fam_rows:
+            db.session.execute(insert(Family), fam_rows)
+        if person_rows:
+            db.session.execute(insert(Person), person_rows)
+        db.session.commit()
+
+
+@app.route("/import", methods=["GET", "POST"])
+def import_csv():
+    report = None
+    if request.method == "POST":
+        file = request.files.get("file")
+        if not file:
+            return redirect(url_for("import_csv"))
+        report = validate_import(file.stream, load_config())
+        report["dry_run"] = request.form.get("mode") != "import"
+        if not report["dry_run"] and not report["errors"]:
+            import_families(report["families"])
+            return redirect(url_for("families_list"))
+    return render_template("import.html", report=report)
+
+
+@app.cli.command("import-csv")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--dry-run", is_flag=True, help="Valide le fichier sans rien importer.")
+def import_csv_command(path, dry_run):
+    """Importe des personnes (et leurs familles) depuis un fichier CSV."""
+    with open(path, "rb") as fh:
+        report = validate_import(fh, load_config())
+    for lineno, message in report["errors"]:
+        print(f"ligne {lineno} : {message}")
+    print(f"{report['rows']} ligne(s), {report['new_families']} nouvelle(s) famille(s), {report['persons']} personne(s)")
+    if report["errors"]:
+        raise SystemExit(1)
+    if not dry_run:
+        import_families(report["families"])
+        print("Import terminé")
+
 # ----- Sauvegarde / Restauration JSON -----
 
-@app.route("/backup")
-def backup():
-    data = {
-        "families": [
-            {
-                "id": f.id,
-                "label": f.label,
-                "room_number": f.room_number,
-                "room_number2": f.room_number2,
-                "arrival_date": f.arrival_date.isoformat() if f.arrival_date else None,
-                "departure_date": f.departure_date.isoformat() if f.departure_date else None,
-                "phone1": f.phone1,
-                "phone2": f.phone2,
-            }
-            for f in Family.query.order_by(Family.id.asc()).all()
-        ],
-        "persons": [
-            {
-                "id": p.id,
-                "family_id": p.family_id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "dob": p.dob.isoformat() if p.dob else None,
-                "sex": p.sex,
-                "phone": p.phone,
-            }
-            for p in Person.query.order_by(Person.id.asc()).all()
-        ],
+def family_to_dict(f) -> dict:
+    return {
+        "id": f.id,
+        "label": f.label,
+        "room_number": f.room_number,
+        "room_number2": f.room_number2,
+        "arrival_date": f.arrival_date.isoformat() if f.arrival_date else None,
+        "departure_date": f.departure_date.isoformat() if f.departure_date else None,
+        "phone1": f.phone1,
+        "phone2": f.phone2,
+    }
+
+
+def person_to_dict(p) -> dict:
+    return {
+        "id": p.id,
+        "family_id": p.family_id,
+        "first_name": p.first_name,
+        "last_name": p.last_name,
+        "dob": p.dob.isoformat() if p.dob else None,
+        "sex": p.sex,
+        "phone": p.phone,
     }
+
+
+def json_attachment(data: dict, filename: str):
     resp = make_response(json.dumps(data, ensure_ascii=False))
     resp.headers["Content-Type"] = "application/json; charset=utf-8"
-    resp.headers["Content-Disposition"] = "attachment; filename=backup.json"
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
     return resp
 
+
+def restore_tier(families: list[dict], persons: list[dict], F, P) -> None:
+    """Remplace le contenu d'un niveau (actif ou archive) par les données fournies."""
+    P.query.delete()
+    F.query.delete()
+    db.session.commit()
+    if F is Family:
+        try:
+            db.session.execute(db.text("DELETE FROM sqlite_sequence WHERE name IN ('family','person')"))
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()
+    for f in families:
+        fam = F(
+            id=f.get("id"),
+            label=f.get("label"),
+            room_number=f.get("room_number"),
+            room_number2=f.get("room_number2"),
+            arrival_date=parse_date(f.get("arrival_date")),
+            departure_date=parse_date(f.get("departure_date")),
+            phone1=f.get("phone1"),
+            phone2=f.get("phone2"),
+        )
+        db.session.add(fam)
+    db.session.commit()
+    for p in persons:
+        pers = P(
+            id=p.get("id"),
+            family_id=p.get("family_id"),
+            first_name=p.get("first_name"),
+            last_name=p.get("last_name"),
+            dob=parse_date(p.get("dob")),
+            sex=p.get("sex"),
+            phone=p.get("phone"),
+        )
+        db.session.add(pers)
+    db.session.commit()
+
+
+@app.route("/backup")
+@conditional
+def backup():
+    # Données actives uniquement ; les archives ont leur propre sauvegarde.
+    with reporting() as rs:
+        data = {
+            "families": [family_to_dict(f) for f in rs.query(Family).order_by(Family.id.asc()).all()],
+            "persons": [person_to_dict(p) for p in rs.query(Person).order_by(Person.id.asc()).all()],
+            # Point de départ pour /changes?since=… après chargement de cette sauvegarde
+            "change_seq": rs.execute(text(
+                "SELECT max(coalesce((SELECT max(seq) FROM change_log), 0), "
+                "coalesce((SELECT CAST(value AS INTEGER) FROM app_state WHERE key = 'changes_horizon'), 0))"
+            )).scalar(),
+        }
+    return json_attachment(data, "backup.json")
+
+@app.route("/backup/archive")
+@conditional
+def backup_archive():
+    with reporting() as rs:
+        data = {
+            "archived_families": [family_to_dict(f) for f in rs.query(ArchivedFamily).order_by(ArchivedFamily.id.asc()).all()],
+            "archived_persons": [person_to_dict(p) for p in rs.query(ArchivedPerson).order_by(ArchivedPerson.id.asc()).all()],
+        }
+    return json_attachment(data, "backup_archive.json")
+
 @app.route("/restore", methods=["GET", "POST"])
 def restore():
     if request.method == "POST":
@@ -1007,46 +3812,300 @@ def restore():
             data = json.load(file.stream)
         except json.JSONDecodeError:
             return redirect(url_for("restore"))
-        Person.query.delete()
-        Family.query.delete()
-        db.session.commit()
-        try:
-            db.session.execute(db.text("DELETE FROM sqlite_sequence WHERE name IN ('family','person')"))
-            db.session.commit()
-        except OperationalError:
-            db.session.rollback()
-        for f in data.get("families", []):
-            fam = Family(
-                id=f.get("id"),
-                label=f.get("label"),
-                room_number=f.get("room_number"),
-                room_number2=f.get("room_number2"),
-                arrival_date=parse_date(f.get("arrival_date")),
-                departure_date=parse_date(f.get("departure_date")),
-                phone1=f.get("phone1"),
-                phone2=f.get("phone2"),
-            )
-            db.session.add(fam)
-        db.session.commit()
-        for p in data.get("persons", []):
-            pers = Person(
-                id=p.get("id"),
-                family_id=p.get("family_id"),
-                first_name=p.get("first_name"),
-                last_name=p.get("last_name"),
-                dob=parse_date(p.get("dob")),
-                sex=p.get("sex"),
-                phone=p.get("phone"),
-            )
-            db.session.add(pers)
-        db.session.commit()
+        # Un fichier peut contenir les données actives, les archives, ou les deux.
+        if "families" in data or "persons" in data:
+            restore_tier(data.get("families", []), data.get("persons", []), Family, Person)
+        if "archived_families" in data or "archived_persons" in data:
+            restore_tier(data.get("archived_families", []), data.get("archived_persons", []), ArchivedFamily, ArchivedPerson)
+        rebuild_counters()
         return redirect(url_for("dashboard"))
     return render_template("restore.html")
 
 
+# ----- Sauvegardes incrémentales -----
+
+# Une chaîne de sauvegardes = une sauvegarde de base puis des deltas, dans
+# backups/ à côté de la base. Chaque delta ne contient que les lignes dont
+# l'empreinte a changé (ou qui ont été supprimées) depuis le fichier précédent :
+# les lignes à examiner sont notées dans backup_pending par des triggers, et
+# index.db (SQLite) conserve l'empreinte de chaque ligne sauvegardée : un delta
+# n'y lit et n'y écrit que les lignes touchées. manifest.json liste la chaîne
+# (empreinte de chaque fichier et de son parent) avec une somme de contrôle de
+# l'index, tenue à jour ligne par ligne (somme modulo 2**64 d'un terme par ligne).
+BACKUP_TABLES = {
+    "family": Family,
+    "person": Person,
+    "archived_family": ArchivedFamily,
+    "archived_person": ArchivedPerson,
+}
+
+
+def backup_pending_triggers(schema: str) -> list[str]:
+    statements = []
+    for table in ("family", "person"):
+        name = table if schema == "main" else f"archived_{table}"
+        temp = "" if schema == "main" else "TEMP "
+        for op, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            statements.append(
+                f"CREATE {temp}TRIGGER IF NOT EXISTS {name}_{op.lower()}_backup AFTER {op} ON {schema}.{table} "
+                f"BEGIN INSERT OR IGNORE INTO backup_pending (table_name, row_id) VALUES ('{name}', {row}.id); END"
+            )
+    return statements
+
+
+def backup_dir() -> str:
+    path = db.engine.url.database
+    root = os.path.dirname(path) if path and path != ":memory:" else app.instance_path
+    return os.path.join(root, "backups")
+
+
+def row_to_dict(table: str, row) -> dict:
+    return family_to_dict(row) if table.endswith("family") else person_to_dict(row)
+
+
+def row_hash(data: dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _read_json_gz(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json_gz(path: str, data) -> None:
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def index_term(name: str, row_id: int, digest: str) -> int:
+    return int(hashlib.sha256(f"{name}:{row_id}:{digest}".encode("utf-8")).hexdigest()[:16], 16)
+
+
+def index_checksum(state: dict[str, dict[int, dict]]) -> str:
+    """Somme de contrôle de l'index correspondant à un état rejoué."""
+    total = sum(index_term(name, rid, row_hash(row)) for name, rows in state.items() for rid, row in rows.items())
+    return f"{total % (1 << 64):016x}"
+
+
+def open_backup_index(directory: str, chain: list[dict], base: bool) -> tuple[sqlite3.Connection, int]:
+    """Index des empreintes dans une transaction ouverte, et sa somme de contrôle.
+
+    Remis à zéro pour une base ; reconstruit par rejeu de la chaîne s'il ne
+    correspond pas au dernier fichier du manifest (interruption, ancien format).
+    """
+    conn = sqlite3.connect(os.path.join(directory, "index.db"), isolation_level=None)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS row_hash (table_name TEXT, row_id INTEGER, digest TEXT, "
+        "PRIMARY KEY (table_name, row_id)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("BEGIN IMMEDIATE")
+    meta = dict(conn.execute("SELECT key, value FROM meta"))
+    if not base and chain and meta.get("last") == chain[-1]["file"]:
+        return conn, int(meta["checksum"], 16)
+    conn.execute("DELETE FROM row_hash")
+    checksum = 0
+    if not base:
+        for name, rows in replay_backup_chain(chain).items():
+            for rid, row in rows.items():
+                digest = row_hash(row)
+                conn.execute("INSERT INTO row_hash VALUES (?, ?, ?)", (name, rid, digest))
+                checksum += index_term(name, rid, digest)
+    return conn, checksum % (1 << 64)
+
+
+def load_manifest() -> dict:
+    try:
+        with open(os.path.join(backup_dir(), "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"chain": []}
+
+
+def create_incremental_backup(base: bool = False) -> dict:
+    """Ajoute un fichier à la chaîne (base si demandé ou si la chaîne est vide) ; retourne son entrée."""
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest()
+    base = base or not manifest["chain"]
+    index, checksum = open_backup_index(directory, manifest["chain"], base)
+    # Vider la liste des lignes modifiées prend le verrou d'écriture : rien ne
+    # peut changer entre cette lecture et le commit final.
+    pending = db.session.execute(text("DELETE FROM backup_pending RETURNING table_name, row_id")).all()
+    try:
+        tables = {}
+        for name, model in BACKUP_TABLES.items():
+            if base:
+                rows = db.session.execute(db.select(model)).scalars()
+            else:
+                ids = [rid for t, rid in pending if t == name]
+                rows = []
+                for start in range(0, len(ids), 500):
+                    rows += db.session.execute(db.select(model).where(model.id.in_(ids[start:start + 500]))).scalars().all()
+            upsert, found = [], set()
+            for row in rows:
+                data = row_to_dict(name, row)
+                found.add(row.id)
+                digest = row_hash(data)
+                old = None if base else index.execute(
+                    "SELECT digest FROM row_hash WHERE table_name = ? AND row_id = ?", (name, row.id)
+                ).fetchone()
+                if old is None or old[0] != digest:
+                    if old is not None:
+                        checksum -= index_term(name, row.id, old[0])
+                    checksum += index_term(name, row.id, digest)
+                    index.execute("INSERT OR REPLACE INTO row_hash VALUES (?, ?, ?)", (name, row.id, digest))
+                    upsert.append(data)
+            deleted = []
+            for t, rid in pending:
+                if t != name or rid in found:
+                    continue
+                old = index.execute("DELETE FROM row_hash WHERE table_name = ? AND row_id = ? RETURNING digest", (name, rid)).fetchone()
+                if old is not None:
+                    checksum -= index_term(name, rid, old[0])
+                    deleted.append(rid)
+            tables[name] = {"upsert": upsert, "delete": deleted}
+        checksum %= 1 << 64
+        created = datetime.now(timezone.utc).replace(tzinfo=None)
+        parent = manifest["chain"][-1]["sha256"] if manifest["chain"] and not base else None
+        filename = f"{created:%Y%m%d-%H%M%S-%f}-{'base' if base else 'delta'}.json.gz"
+        path = os.path.join(directory, filename)
+        _write_json_gz(path, {"kind": "base" if base else "delta", "created": created.isoformat(), "parent": parent, "tables": tables})
+        entry = {
+            "file": filename,
+            "kind": "base" if base else "delta",
+            "created": created.isoformat(),
+            "parent": parent,
+            "sha256": file_sha256(path),
+            "rows": sum(len(t["upsert"]) for t in tables.values()),
+            "deletes": sum(len(t["delete"]) for t in tables.values()),
+            "checksum": f"{checksum:016x}",
+        }
+        manifest["chain"] = ([] if base else manifest["chain"]) + [entry]
+        tmp = os.path.join(directory, "manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(directory, "manifest.json"))
+        # Index validé après le manifest : s'il manque ce commit, il sera reconstruit
+        index.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (("last", filename), ("checksum", entry["checksum"])),
+        )
+        index.execute("COMMIT")
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        index.close()
+    db.session.commit()
+    return entry
+
+
+def verify_backup_chain() -> list[str]:
+    """Vérifie la chaîne (fichiers présents, empreintes, parents) ; retourne les problèmes trouvés."""
+    chain = load_manifest()["chain"]
+    if not chain:
+        return ["aucune sauvegarde incrémentale"]
+    problems = []
+    previous = None
+    for i, entry in enumerate(chain):
+        path = os.path.join(backup_dir(), entry["file"])
+        if (entry["kind"] == "base") != (i == 0):
+            problems.append(f"{entry['file']} : la chaîne doit commencer par une base (et une seule)")
+        if entry["parent"] != previous:
+            problems.append(f"{entry['file']} : parent inattendu")
+        if not os.path.exists(path):
+            problems.append(f"{entry['file']} : fichier manquant")
+        elif file_sha256(path) != entry["sha256"]:
+            problems.append(f"{entry['file']} : empreinte incorrecte")
+        previous = entry["sha256"]
+    if not problems and index_checksum(replay_backup_chain(chain)) != chain[-1].get("checksum"):
+        problems.append("le rejeu de la chaîne ne redonne pas les empreintes attendues")
+    return problems
+
+
+def replay_backup_chain(chain: list[dict]) -> dict[str, dict[int, dict]]:
+    state: dict[str, dict[int, dict]] = {name: {} for name in BACKUP_TABLES}
+    for entry in chain:
+        data = _read_json_gz(os.path.join(backup_dir(), entry["file"]))
+        for name, change in data["tables"].items():
+            rows = state[name]
+            for row in change["upsert"]:
+                rows[row["id"]] = row
+            for rid in change["delete"]:
+                rows.pop(rid, None)
+    return state
+
+
+def restore_backup_chain() -> None:
+    """Remplace toutes les données par l'état final de la chaîne (insertion groupée)."""
+    state = replay_backup_chain(load_manifest()["chain"])
+    dates = ("arrival_date", "departure_date", "dob")
+    for name in ("archived_person", "archived_family", "person", "family"):
+        db.session.execute(db.delete(BACKUP_TABLES[name]))
+    for name in ("family", "person", "archived_family", "archived_person"):
+        rows = [
+            {k: (parse_date(v) if k in dates else v) for k, v in row.items()}
+            for row in state[name].values()
+        ]
+        for start in range(0, len(rows), 1000):
+            db.session.execute(insert(BACKUP_TABLES[name]), rows[start:start + 1000])
+    db.session.commit()
+    rebuild_counters()
+
+
+@daily_job
+def incremental_backup_job(today: date) -> None:
+    # Deltas quotidiens seulement une fois la chaîne démarrée (commande backup-incremental --base)
+    if load_manifest()["chain"]:
+        create_incremental_backup()
+
+
+@app.cli.command("backup-incremental")
+@click.option("--base", is_flag=True, help="Démarre une nouvelle chaîne par une sauvegarde complète.")
+def backup_incremental_command(base):
+    """Ajoute une sauvegarde (delta, ou base) à la chaîne de backups/."""
+    entry = create_incremental_backup(base)
+    print(f"{entry['file']} : {entry['rows']} ligne(s), {entry['deletes']} suppression(s)")
+
+
+@app.cli.command("backup-verify")
+def backup_verify_command():
+    """Vérifie la chaîne de sauvegardes incrémentales."""
+    problems = verify_backup_chain()
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise SystemExit(1)
+    print(f"Chaîne valide ({len(load_manifest()['chain'])} fichier(s))")
+
+
+@app.cli.command("backup-restore")
+@click.confirmation_option(prompt="Cette action écrasera les données actuelles. Continuer ?")
+def backup_restore_command():
+    """Restaure la base à partir de la chaîne de sauvegardes incrémentales."""
+    problems = verify_backup_chain()
+    if problems:
+        raise click.ClickException("; ".join(problems))
+    restore_backup_chain()
+    print("Restauration terminée")
+
+
 @app.route("/config/export")
 def config_export():
     cfg = load_config()
+    # Fichier autonome : les plans d'étage y sont recopiés en entier
+    cfg["layout"]["floors"] = floor_layouts(cfg, with_data=True)
     resp = make_response(json.dumps(cfg, ensure_ascii=False, indent=2))
     resp.headers["Content-Type"] = "application/json; charset=utf-8"
     resp.headers["Content-Disposition"] = "attachment; filename=config.json"
@@ -1059,7 +4118,12 @@ def config_import():
     if file:
         try:
             data = json.load(file.stream)
+            previous = floor_digests(load_config())
+            externalize_floors(data)
             save_config(data)
+            prune_floors(previous, data)
+            sync_alerts(db.session)
+            db.session.commit()
         except json.JSONDecodeError:
             pass
     return redirect(url_for("config"))
@@ -1071,6 +4135,7 @@ def config():
     cfg = load_config()
     rooms = generate_rooms(cfg)
     if request.method == "POST":
+        previous = floor_digests(cfg)
         hotel = cfg["hotel"]
         hotel["total_rooms"] = request.form.get("total_rooms", "")
         hotel["numbering"] = request.form.get("numbering", "numeric")
@@ -1137,6 +4202,12 @@ def config():
             box_layout[key] = {"order": order, "width": width}
         dashboard_cfg["layout"] = box_layout
 
+        archive_cfg = cfg.setdefault("archive", {})
+        try:
+            archive_cfg["after_days"] = int(request.form.get("archive_after_days", 90))
+        except ValueError:
+            archive_cfg["after_days"] = 90
+
         layout = cfg.setdefault("layout", {})
         layout_json = request.form.get("layout_json", "[]")
         try:
@@ -1176,26 +4247,23 @@ def config():
             if key in seen_names:
                 continue
             seen_names.add(key)
-            stage_data = f.get("data")
-            rooms, width, height = extract_room_layout(stage_data, cell_w, cell_h)
-            floors.append({
-                "name": name,
-                "data": stage_data,
-                "rooms": rooms,
-                "width": width,
-                "height": height,
-            })
+            floors.append({"name": name, "layout": store_floor(f.get("data"), cell_w, cell_h)})
         layout["floors"] = floors
 
         save_config(cfg)
+        prune_floors(previous, cfg)
+        sync_alerts(db.session)
+        db.session.commit()
         return redirect(url_for("config"))
     groups_text = "\n".join(
         f"{','.join(g['rooms'])}:{g['max']}" for g in cfg.get("occupation", {}).get("groups", [])
     )
-    return render_template("config.html", config=cfg, rooms=rooms, groups_text=groups_text)
+    floors = [{"name": f["name"], "data": f.get("data")} for f in floor_layouts(cfg, with_data=True)]
+    return render_template("config.html", config=cfg, rooms=rooms, groups_text=groups_text, floors=floors)
 
 # ============================
 with app.app_context():
+    event.listen(db.engine, "connect", configure_connection)
     try:
         db.session.execute(text("ALTER TABLE family ADD COLUMN room_number2 VARCHAR(20)"))
         db.session.commit()
@@ -1216,7 +4284,25 @@ with app.app_context():
         db.session.commit()
     except OperationalError:
         db.session.rollback()
+    try:
+        db.session.execute(text("ALTER TABLE change_log ADD COLUMN movement VARCHAR(10)"))
+        db.session.commit()
+    except OperationalError:
+        db.session.rollback()
     db.create_all()
+    db.session.execute(text(
+        "INSERT OR IGNORE INTO data_version (id, version, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)"
+    ))
+    db.session.execute(text("INSERT OR IGNORE INTO app_state (key, value) VALUES ('daily_jobs', '')"))
+    install_triggers(data_version_triggers("main") + change_log_triggers() + backup_pending_triggers("main") + family_version_triggers() + stat_counter_triggers())
+    db.session.commit()
+    # Les connexions ouvertes avant la création des tables n'ont pas les triggers TEMP
+    db.engine.dispose()
+    if db.session.get(AppState, "stats_date") is None:
+        rebuild_counters()
+    # Première installation ou configuration modifiée hors de l'application
+    if sync_alerts(db.session):
+        db.session.commit()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,325 @@
+# loadtest.py  —  FlexiLogis • test de charge local
+#
+# Démarre une instance locale sur une base synthétique (répertoire temporaire,
+# la base réelle n'est jamais touchée), puis simule des réceptionnistes :
+# consultation du dashboard, recherches, modifications de familles, départs,
+# retours et ajouts de personnes. Affiche par route le débit, les latences
+# p50/p95/p99 et le taux d'erreurs « database is locked ».
+#
+#   python loadtest.py --concurrency 8 --duration 30
+#   python loadtest.py --url http://127.0.0.1:5000 --concurrency 16   # instance déjà lancée
+#
+# Uniquement la bibliothèque standard : fonctionne hors ligne.
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAST_NAMES = ["Martin", "Bernard", "Dubois", "Diallo", "Nguyen", "Haddad", "Moreau", "Traoré", "Petit", "Garcia"]
+FIRST_NAMES = ["Marie", "Jean", "Fatou", "Ali", "Emma", "Lucas", "Aya", "Omar", "Léa", "Hugo"]
+
+
+# ----- Instance locale et données synthétiques -----
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_instance(workdir: str, rooms: int) -> tuple[subprocess.Popen, str]:
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "hotel": {"numbering": "numeric", "numeric_start": 1, "numeric_end": rooms, "total_rooms": rooms},
+            "occupation": {"default_max": 4, "groups": [], "per_room": {}},
+        }, f)
+    port = free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=HERE,
+        FLEXILOGIS_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'flexilogis.db')}",
+        FLEXILOGIS_CONFIG=os.path.join(workdir, "config.json"),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-c", f"import app; app.app.run(port={port}, threaded=True)"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            request(base, "GET", "/families")
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("L'instance locale n'a pas démarré")
+
+
+def seed(base: str, families: int, rooms: int) -> None:
+    """Remplit la base via l'import CSV (une seule requête)."""
+    rnd = random.Random(42)
+    lines = ["family_id,family_label,room_number,last_name,first_name,dob,sex,arrival_date"]
+    for i in range(families):
+        last = rnd.choice(LAST_NAMES)
+        arrival = f"{rnd.randint(2022, 2025)}-{rnd.randint(1, 12):02d}-01"
+        for _ in range(rnd.randint(1, 5)):
+            lines.append(",".join([
+                f"{i + 1}", f"Famille {last} {i}", str(1 + i % rooms), last, rnd.choice(FIRST_NAMES),
+                f"{rnd.randint(1950, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                rnd.choice("FM"), arrival,
+            ]))
+    status, body = request(base, "POST", "/import", files={"file": "\n".join(lines).encode()}, fields={"mode": "import"})
+    if status != 302:
+        raise SystemExit(f"Échec de l'import synthétique ({status}) : {body[:500]!r}")
+
+
+# ----- Client HTTP -----
+
+def request(base: str, method: str, path: str, fields: dict | None = None, files: dict | None = None) -> tuple[int, bytes]:
+    url = urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+    headers = {}
+    body = None
+    if files:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in (fields or {}).items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, content in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.csv"\r\n'
+                "Content-Type: text/csv\r\n\r\n".encode() + content + b"\r\n"
+            )
+        body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+        headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+    elif fields is not None:
+        body = urlencode(fields).encode()
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def family_ids(base: str) -> list[int]:
+    _status, body = request(base, "GET", "/export/families.csv")
+    lines = body.decode("utf-8-sig").splitlines()[1:]
+    return [int(line.split(",", 1)[0]) for line in lines if line]
+
+
+# ----- Scénarios -----
+
+class Pool:
+    """Familles présentes / parties, partagées entre les réceptionnistes simulés."""
+    def __init__(self, active: list[int]):
+        self.lock = threading.Lock()
+        self.active = list(active)
+        self.departed: list[int] = []
+
+    def pick(self, rnd: random.Random, departed: bool = False) -> int | None:
+        with self.lock:
+            source = self.departed if departed else self.active
+            return rnd.choice(source) if source else None
+
+    def move(self, fid: int, departed: bool) -> None:
+        with self.lock:
+            src, dst = (self.active, self.departed) if departed else (self.departed, self.active)
+            if fid in src:
+                src.remove(fid)
+                dst.append(fid)
+
+
+def scenario_dashboard(base, rnd, pool):
+    yield "GET /", request(base, "GET", "/")
+    for name in ("alerts", "total_clients", "sex_chart", "age_groups", "birthdays", "tenures", "room_layout", "recent_families"):
+        yield "GET /dashboard/widgets/*", request(base, "GET", f"/dashboard/widgets/{name}")
+
+
+def scenario_search(base, rnd, pool):
+    params = urlencode({"p_last": rnd.choice(LAST_NAMES)[:3], "p_first": rnd.choice(FIRST_NAMES)[:2]})
+    yield "GET /search", request(base, "GET", f"/search?{params}")
+    yield "GET /residents", request(base, "GET", "/residents")
+
+
+def scenario_edit_family(base, rnd, pool):
+    fid = pool.pick(rnd)
+    if fid is None:
+        return
+    yield "GET /families/<id>/edit", request(base, "GET", f"/families/{fid}/edit")
+    yield "POST /families/<id>/edit", request(base, "POST", f"/families/{fid}/edit", fields={
+        "label": f"Famille {rnd.choice(LAST_NAMES)} {fid}", "room_number": str(rnd.randint(1, 50)),
+        "arrival_date": "01/09/2025", "phone1": f"06{rnd.randrange(10 ** 8):08d}",
+    })
+
+
+def scenario_departure(base, rnd, pool):
+    # Départs et retours s'équilibrent pour garder un nombre de familles stable
+    back = rnd.random() < 0.5
+    fid = pool.pick(rnd, departed=back)
+    if fid is None:
+        return
+    date = "" if back else time.strftime("%Y-%m-%d")
+    result = request(base, "POST", f"/families/{fid}/depart", fields={"departure_date": date})
+    if result[0] == 302:
+        pool.move(fid, departed=not back)
+    yield "POST /families/<id>/depart", result
+
+
+def scenario_add_person(base, rnd, pool):
+    fid = pool.pick(rnd)
+    if fid is None:
+        return
+    yield "GET /persons/<id>", request(base, "GET", f"/persons/{fid}")
+    yield "POST /persons/<id>/new", request(base, "POST", f"/persons/{fid}/new", fields={
+        "first_name": rnd.choice(FIRST_NAMES), "last_name": rnd.choice(LAST_NAMES),
+        "dob": f"{rnd.randint(1950, 2025)}-0{rnd.randint(1, 9)}-1{rnd.randint(0, 9)}", "sex": rnd.choice("FM"),
+    })
+
+
+SCENARIOS = {
+    "dashboard": scenario_dashboard,
+    "search": scenario_search,
+    "edit": scenario_edit_family,
+    "departure": scenario_departure,
+    "person": scenario_add_person,
+}
+DEFAULT_MIX = "dashboard=4,search=3,edit=1,departure=1,person=1"
+
+
+# ----- Exécution et rapport -----
+
+def worker(base, mix, pool, deadline, seed_value, results, lock):
+    rnd = random.Random(seed_value)
+    names, weights = zip(*mix.items())
+    local: list[tuple[str, float, int, bool]] = []
+    while time.monotonic() < deadline:
+        scenario = SCENARIOS[rnd.choices(names, weights)[0]]
+        steps = scenario(base, rnd, pool)
+        while True:
+            start = time.perf_counter()
+            try:
+                route, (status, body) = next(steps)
+            except StopIteration:
+                break
+            except OSError:
+                route, status, body = "connexion", 0, b""
+            elapsed = time.perf_counter() - start
+            local.append((route, elapsed, status, b"database is locked" in body))
+    with lock:
+        results.extend(local)
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def report(results, duration: float) -> dict:
+    by_route: dict[str, list] = {}
+    for route, elapsed, status, locked in results:
+        by_route.setdefault(route, []).append((elapsed, status, locked))
+    rows = {}
+    for route in sorted(by_route):
+        samples = by_route[route]
+        latencies = sorted(e for e, _s, _l in samples)
+        rows[route] = {
+            "requests": len(samples),
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "errors": sum(1 for _e, s, _l in samples if s == 0 or s >= 500),
+            "locked_pct": 100 * sum(1 for *_x, l in samples if l) / len(samples),
+        }
+    return rows
+
+
+def print_report(rows: dict, duration: float, concurrency: int) -> None:
+    total = sum(r["requests"] for r in rows.values())
+    print(f"\n{concurrency} réceptionnistes simulés, {duration:.0f} s, {total} requêtes ({total / duration:.1f} req/s)\n")
+    header = f"{'route':32} {'req':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5} {'locked':>7}"
+    print(header)
+    print("-" * len(header))
+    for route, r in rows.items():
+        print(
+            f"{route:32} {r['requests']:6d} {r['rps']:7.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+            f"{r['p99_ms']:8.1f} {r['errors']:5d} {r['locked_pct']:6.2f}%"
+        )
+
+
+def parse_mix(raw: str) -> dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Scénario inconnu : {name} (disponibles : {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Test de charge local de FlexiLogis")
+    parser.add_argument("--url", help="Instance déjà démarrée (sinon une instance synthétique est lancée)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Nombre de réceptionnistes simulés")
+    parser.add_argument("--duration", type=float, default=30, help="Durée du test en secondes")
+    parser.add_argument("--families", type=int, default=300, help="Familles de la base synthétique")
+    parser.add_argument("--rooms", type=int, default=120, help="Chambres de l'hôtel synthétique")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pondération des scénarios (défaut : {DEFAULT_MIX})")
+    parser.add_argument("--json", help="Écrit aussi le rapport dans ce fichier JSON")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    proc = workdir = None
+    base = args.url
+    try:
+        if not base:
+            workdir = tempfile.mkdtemp(prefix="flexilogis-load-")
+            proc, base = start_instance(workdir, args.rooms)
+            seed(base, args.families, args.rooms)
+        pool = Pool(family_ids(base))
+        results: list = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=worker, args=(base, mix, pool, deadline, i, results, lock))
+            for i in range(args.concurrency)
+        ]
+        started = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = time.monotonic() - started
+        rows = report(results, duration)
+        print_report(rows, duration, args.concurrency)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"concurrency": args.concurrency, "duration": duration, "routes": rows}, f, indent=2)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# sites.py  —  FlexiLogis • mode multi-sites
+#
+# Sert plusieurs hôtels depuis un même processus. Chaque site garde sa propre
+# base SQLite (et ses archives, sauvegardes...) et son propre config.json ; il
+# est choisi par préfixe d'URL (/nord/...) ou par nom d'hôte. La racine affiche
+# une vue consolidée, /stats la renvoie en JSON.
+#
+#   python sites.py                      # lit sites.json à côté de ce fichier
+#   python sites.py --sites /srv/hotels.json --host 0.0.0.0 --port 8000
+#
+# sites.json (chemins relatifs au fichier) :
+#
+#   {"sites": [
+#     {"name": "nord", "label": "Hôtel Nord", "database": "nord/flexilogis.db",
+#      "config": "nord/config.json", "hosts": ["nord.exemple.fr"]},
+#     {"name": "sud", "label": "Hôtel Sud", "database": "sud/flexilogis.db", "config": "sud/config.json"}
+#   ]}
+#
+# Les commandes flask d'un site s'utilisent avec les mêmes variables que celles
+# positionnées ici : FLEXILOGIS_DATABASE_URI=sqlite:////chemin/flexilogis.db
+# FLEXILOGIS_CONFIG=/chemin/config.json flask --app app backup-incremental
+#
+# Les chiffres consolidés sont calculés en parallèle dans un pool de processus
+# (un site par processus au plus) : une vue sur dix sites coûte à peu près le
+# temps du site le plus lent, et non la somme.
+
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import Flask, render_template
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.serving import run_simple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SITES_FILE = os.environ.get("FLEXILOGIS_SITES", os.path.join(HERE, "sites.json"))
+STATS_TIMEOUT = 60
+
+# Modules app.py chargés dans ce processus, un par site
+_site_modules: dict = {}
+_pool = None
+
+
+def load_sites(path: str = SITES_FILE) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        sites = json.load(f)["sites"]
+    base = os.path.dirname(os.path.abspath(path))
+    names = set()
+    for site in sites:
+        if not site.get("name", "").isidentifier() or site["name"] in names:
+            raise ValueError(f"nom de site invalide ou en double : {site.get('name')!r}")
+        names.add(site["name"])
+        site.setdefault("label", site["name"])
+        site.setdefault("hosts", [])
+        site["database"] = os.path.join(base, site.get("database") or os.path.join(site["name"], "flexilogis.db"))
+        site["config"] = os.path.join(base, site.get("config") or os.path.join(site["name"], "config.json"))
+    return sites
+
+
+def site_module(site: dict):
+    """Charge app.py une fois par site, sous un nom de module propre : chaque
+    site a ainsi son application Flask, son moteur SQLAlchemy et ses caches."""
+    name = f"flexilogis_{site['name']}"
+    if name not in _site_modules:
+        os.makedirs(os.path.dirname(site["database"]), exist_ok=True)
+        os.environ["FLEXILOGIS_DATABASE_URI"] = f"sqlite:///{site['database']}"
+        os.environ["FLEXILOGIS_CONFIG"] = site["config"]
+        try:
+            spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, "app.py"))
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[name] = module
+            spec.loader.exec_module(module)
+        finally:
+            os.environ.pop("FLEXILOGIS_DATABASE_URI", None)
+            os.environ.pop("FLEXILOGIS_CONFIG", None)
+        _site_modules[name] = module
+    return _site_modules[name]
+
+
+def site_stats(site: dict) -> dict:
+    """Exécuté dans un processus du pool : chiffres d'un site."""
+    module = site_module(site)
+    with module.app.app_context():
+        try:
+            return module.site_summary()
+        finally:
+            module.db.session.remove()
+
+
+def stats_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn : les processus ne doivent pas hériter des connexions SQLite ouvertes
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def merge_stats(total: dict, part: dict) -> None:
+    for key, value in part.items():
+        if isinstance(value, dict):
+            merge_stats(total.setdefault(key, {}), value)
+        elif isinstance(value, (int, float)) and key != "version":
+            total[key] = total.get(key, 0) + value
+
+
+def consolidated_stats(sites: list[dict]) -> dict:
+    pool = stats_pool(min(len(sites), os.cpu_count() or 1))
+    futures = {site["name"]: pool.submit(site_stats, site) for site in sites}
+    per_site, errors, total = {}, {}, {}
+    for site in sites:
+        try:
+            per_site[site["name"]] = futures[site["name"]].result(timeout=STATS_TIMEOUT)
+        except Exception as e:
+            errors[site["name"]] = str(e) or type(e).__name__
+            continue
+        merge_stats(total, per_site[site["name"]])
+    return {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "total": total,
+        "sites": per_site,
+        "errors": errors,
+    }
+
+
+def create_hub(sites: list[dict]) -> Flask:
+    hub = Flask(__name__)
+
+    @hub.route("/")
+    def consolidated():
+        return render_template("sites.html", sites=sites, stats=consolidated_stats(sites))
+
+    @hub.route("/stats")
+    def stats():
+        return consolidated_stats(sites)
+
+    return hub
+
+
+class SiteDispatcher:
+    """Choisit le site d'après le nom d'hôte, sinon d'après le préfixe d'URL."""
+
+    def __init__(self, sites: list[dict]):
+        apps = {site["name"]: site_module(site).app for site in sites}
+        self.by_host = {host.lower(): apps[site["name"]] for site in sites for host in site["hosts"]}
+        self.by_prefix = DispatcherMiddleware(create_hub(sites), {f"/{name}": app for name, app in apps.items()})
+
+    def __call__(self, environ, start_response):
+        host = environ.get("HTTP_HOST", "").rsplit(":", 1)[0].lower()
+        app = self.by_host.get(host)
+        if app is not None:
+            return app(environ, start_response)
+        return self.by_prefix(environ, start_response)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FlexiLogis multi-sites")
+    parser.add_argument("--sites", default=SITES_FILE, help="fichier de définition des sites")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    run_simple(args.host, args.port, SiteDispatcher(load_sites(args.sites)), threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+// Suggestions à la frappe pour les champs portant data-lookup="<url de /api/lookup>".
+// Chaque suggestion est un lien vers la fiche de la famille ou de la personne.
+document.addEventListener('DOMContentLoaded', () => {
+  document.querySelectorAll('input[data-lookup]').forEach(input => {
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu shadow-soft';
+    menu.style.width = '100%';
+    input.setAttribute('autocomplete', 'off');
+    input.parentElement.style.position = 'relative';
+    input.insertAdjacentElement('afterend', menu);
+
+    let timer = null;
+    let request = 0;
+    let active = -1;
+
+    const hide = () => { menu.classList.remove('show'); active = -1; };
+    const items = () => Array.from(menu.querySelectorAll('.dropdown-item'));
+    const highlight = index => {
+      const list = items();
+      if (!list.length) return;
+      active = (index + list.length) % list.length;
+      list.forEach((el, i) => el.classList.toggle('active', i === active));
+    };
+
+    const render = results => {
+      menu.replaceChildren();
+      for (const r of results) {
+        const link = document.createElement('a');
+        link.className = 'dropdown-item d-flex justify-content-between gap-3';
+        link.href = r.url;
+        const label = document.createElement('span');
+        label.innerHTML = `<i class="bi ${r.kind === 'family' ? 'bi-people' : 'bi-person'} me-2"></i>`;
+        label.append(r.label);
+        const detail = document.createElement('small');
+        detail.className = 'text-secondary';
+        detail.textContent = r.detail;
+        link.append(label, detail);
+        menu.appendChild(link);
+      }
+      menu.classList.toggle('show', results.length > 0);
+      active = -1;
+    };
+
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      const q = input.value.trim();
+      if (!q) { hide(); return; }
+      timer = setTimeout(async () => {
+        const current = ++request;
+        const url = input.dataset.lookup + (input.dataset.lookup.includes('?') ? '&' : '?') + new URLSearchParams({ q });
+        const data = await fetch(url, { credentials: 'same-origin' }).then(r => r.json()).catch(() => null);
+        if (data && current === request) render(data.results);
+      }, 100);
+    });
+
+    input.addEventListener('keydown', ev => {
+      if (!menu.classList.contains('show')) return;
+      if (ev.key === 'ArrowDown' || ev.key === 'ArrowUp') {
+        ev.preventDefault();
+        highlight(active + (ev.key === 'ArrowDown' ? 1 : -1));
+      } else if (ev.key === 'Enter' && active >= 0) {
+        ev.preventDefault();
+        window.location.href = items()[active].href;
+      } else if (ev.key === 'Escape') {
+        hide();
+      }
+    });
+
+    // Laisse le temps au clic sur une suggestion d'aboutir
+    input.addEventListener('blur', () => setTimeout(hide, 150));
+  });
+});
@@ -1,12 +1,20 @@
-document.addEventListener('DOMContentLoaded', () => {
-  const tables = document.querySelectorAll('.sortable-table');
+
+// Fichier de traduction DataTables servi localement (voir base.html).
+const DATATABLES_I18N_URL = document.currentScript && document.currentScript.dataset.i18n;
+
+// Initialise les tableaux triables contenus dans ``root`` (document par défaut).
+// Exposé globalement pour les fragments chargés dynamiquement (dashboard).
+window.initSortableTables = (root = document) => {
+  const tables = Array.from(root.querySelectorAll('.sortable-table'))
+    .filter(table => !table.dataset.sortableReady);
+  tables.forEach(table => { table.dataset.sortableReady = '1'; });
 
   // DataTables disponible -> initialisation classique
   if (typeof window.DataTable !== 'undefined') {
     const opts = {
       ordering: true,
       order: [],
-      language: { url: 'https://cdn.datatables.net/plug-ins/2.0.8/i18n/fr-FR.json' },
+      language: DATATABLES_I18N_URL ? { url: DATATABLES_I18N_URL } : {},
       columnDefs: [{ targets: 'no-sort', orderable: false }]
     };
     tables.forEach(table => new DataTable(table, opts));
@@ -44,5 +52,6 @@ document.addEventListener('DOMContentLoaded', () => {
       });
     });
   });
-});
+};
 
+document.addEventListener('DOMContentLoaded', () => window.initSortableTables());
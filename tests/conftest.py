@@ -0,0 +1,38 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# L'application lit sa base et sa configuration à l'import : elles sont
+# redirigées vers un dossier temporaire avant tout import de app.
+_TMP = tempfile.mkdtemp(prefix="flexilogis-tests-")
+os.environ["FLEXILOGIS_DATABASE_URI"] = "sqlite:///" + os.path.join(_TMP, "flexilogis.db")
+os.environ["FLEXILOGIS_CONFIG"] = os.path.join(_TMP, "config.json")
+with open(os.environ["FLEXILOGIS_CONFIG"], "w", encoding="utf-8") as f:
+    json.dump({"hotel": {"numbering": "numeric", "numeric_start": "1", "numeric_end": "40"},
+               "occupation": {"default_max": "4"}}, f)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as flexilogis  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _cleanup():
+    yield
+    with flexilogis.app.app_context():
+        flexilogis.db.engine.dispose()
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    with flexilogis.app.app_context():
+        yield flexilogis
+
+
+@pytest.fixture
+def client():
+    return flexilogis.app.test_client()
@@ -0,0 +1,250 @@
+"""État tenu par les triggers SQLite, comparé à un recalcul après chaque chemin d'écriture.
+
+Chaque test note l'état avant une écriture (lignes, journal, versions,
+backup_pending vidée), passe par une route ou une fonction de l'application,
+puis vérifie :
+
+- stat_counter : égal à compute_counters à la date « stats_date » ;
+- change_log : rejoué sur les lignes d'avant, il redonne les lignes d'après,
+  avec le bon mouvement (arrivée, départ, retour) ;
+- family_version : changée exactement pour les familles touchées ;
+- backup_pending : exactement les lignes touchées ;
+- ids : jamais réattribués, au plus le dernier id réservé (app_state « ids:<table> »).
+
+Lancer : ``python -m pytest tests`` (base et configuration dans un dossier temporaire).
+"""
+import json
+from datetime import date
+from io import BytesIO
+
+import pytest
+from sqlalchemy import text
+
+
+def rows(app, table):
+    cols = app.FAMILY_COLUMNS if table == "family" else app.PERSON_COLUMNS
+    result = app.db.session.execute(text(f"SELECT {', '.join(cols)} FROM main.{table}"))
+    return {r[0]: dict(zip(cols, r)) for r in result}
+
+
+def movement(old, new):
+    was_present = old is not None and old["departure_date"] is None
+    present = new is not None and new["departure_date"] is None
+    if old is None:
+        return "arrival" if present else None
+    if new is None or was_present == present:
+        return None
+    return "return" if present else "departure"
+
+
+class Tracker:
+    def __init__(self, app):
+        self.app = app
+        session = app.db.session
+        self.families = rows(app, "family")
+        self.persons = rows(app, "person")
+        self.seq = session.execute(text("SELECT coalesce(max(seq), 0) FROM change_log")).scalar()
+        self.versions = dict(session.execute(text("SELECT family_id, version FROM family_version")).all())
+        session.execute(text("DELETE FROM backup_pending"))
+        session.commit()
+
+    def check(self):
+        app, session = self.app, self.app.db.session
+        session.rollback()
+        families, persons = dict(self.families), dict(self.persons)
+        touched_families, touched_rows = set(), set()
+        changes = session.execute(text(
+            "SELECT table_name, op, row_id, data, movement FROM change_log WHERE seq > :seq ORDER BY seq"
+        ), {"seq": self.seq}).all()
+        for table, op, row_id, data, logged in changes:
+            data = json.loads(data)
+            touched_rows.add((table, row_id))
+            if table == "family":
+                old = families.pop(row_id, None)
+                new = data if op in ("insert", "update") else None
+                if new is not None:
+                    families[row_id] = new
+                assert logged == movement(old, new), (op, row_id, logged)
+                touched_families.add(row_id)
+            else:
+                old = persons.pop(row_id, None)
+                if op in ("insert", "update"):
+                    persons[row_id] = data
+                touched_families.update(r["family_id"] for r in (old, data) if r and "family_id" in r)
+                assert logged is None
+        assert families == rows(app, "family")
+        assert persons == rows(app, "person")
+
+        versions = dict(session.execute(text("SELECT family_id, version FROM family_version")).all())
+        assert {fid for fid, v in versions.items() if self.versions.get(fid) != v} == touched_families
+
+        pending = set(session.execute(
+            text("SELECT table_name, row_id FROM backup_pending WHERE table_name IN ('family', 'person')")
+        ).all())
+        assert pending == touched_rows
+
+        stats_date = app.parse_date(session.execute(
+            text("SELECT value FROM app_state WHERE key = 'stats_date'")
+        ).scalar())
+        expected = {k: v for k, v in app.compute_counters(stats_date).items() if v}
+        stored = {k: v for k, v in session.execute(text("SELECT key, value FROM stat_counter")).all() if v}
+        assert stored == expected
+
+        for table in ("family", "person"):
+            reserved = int(session.execute(
+                text("SELECT coalesce(value, 0) FROM app_state WHERE key = :key"), {"key": f"ids:{table}"}
+            ).scalar() or 0)
+            assert max(rows(app, table), default=0) <= reserved
+        return changes
+
+
+@pytest.fixture
+def tracked(app):
+    def track():
+        return Tracker(app)
+    return track
+
+
+def new_family(app, client, label, room, persons=(), arrival="2024-01-02"):
+    resp = client.post("/families/new", data={"label": label, "room_number": room, "arrival_date": arrival})
+    assert resp.status_code == 302
+    fid = max(i for i, f in rows(app, "family").items() if f["label"] == label)
+    for first, dob, sex in persons:
+        resp = client.post(f"/persons/{fid}/new", data={"first_name": first, "last_name": label, "dob": dob, "sex": sex})
+        assert resp.status_code == 302
+    return fid
+
+
+def person_ids(app, fid):
+    return [pid for pid, p in rows(app, "person").items() if p["family_id"] == fid]
+
+
+def test_family_and_person_routes(app, client, tracked):
+    t = tracked()
+    fid = new_family(app, client, "Routes", "1", [
+        ("Anne", "1990-05-01", "F"), ("Bissextile", "2000-02-29", "F"), ("Sansdate", "", "M"),
+        ("Enfant", "2015-03-03", "M"), ("Autre", "1980-01-01", "Autre/NP"),
+    ])
+    changes = t.check()
+    assert [c.movement for c in changes if c.table_name == "family"] == ["arrival"]
+
+    t = tracked()
+    pid = person_ids(app, fid)[0]
+    assert client.post(f"/persons/{fid}/{pid}/edit", data={
+        "first_name": "Anne", "last_name": "Routes", "dob": "2010-01-01", "sex": "M",
+    }).status_code == 302
+    assert client.post(f"/persons/{fid}/{person_ids(app, fid)[1]}/delete").status_code == 302
+    t.check()
+
+    t = tracked()
+    assert client.post(f"/families/{fid}/depart", data={"departure_date": "2026-01-01"}).status_code == 302
+    assert client.post(f"/families/{fid}/depart", data={"departure_date": ""}).status_code == 302
+    changes = t.check()
+    assert [c.movement for c in changes if c.table_name == "family"] == ["departure", "return"]
+
+    t = tracked()
+    assert client.post(f"/families/{fid}/delete").status_code == 302
+    t.check()
+
+
+def test_person_changes_family(app, client, tracked):
+    a = new_family(app, client, "Depart A", "2", [("Un", "1985-06-01", "F"), ("Deux", "2012-06-01", "M")])
+    b = new_family(app, client, "Depart B", "3", [("Trois", "1970-06-01", "M")])
+    assert client.post(f"/families/{b}/depart", data={"departure_date": "2026-02-01"}).status_code == 302
+
+    t = tracked()
+    pid = person_ids(app, a)[0]
+    app.db.session.get(app.Person, pid).family_id = b   # vers une famille partie
+    app.db.session.commit()
+    t.check()
+
+    t = tracked()
+    app.db.session.get(app.Person, pid).family_id = a
+    app.db.session.commit()
+    t.check()
+
+
+def test_bulk_actions(app, client, tracked):
+    ids = [
+        new_family(app, client, f"Groupe {i}", str(10 + i), [("P", "1990-01-01", "F"), ("E", "2018-01-01", "M")])
+        for i in range(3)
+    ]
+    t = tracked()
+    resp = client.post("/families/bulk", data={"action": "move", "fid": [str(ids[0])], f"room_number-{ids[0]}": "20"})
+    assert resp.status_code == 302
+    t.check()
+
+    t = tracked()
+    resp = client.post("/families/bulk", data={"action": "depart", "fid": [str(ids[1])], "departure_date": "01/03/2026"})
+    assert resp.status_code == 302
+    changes = t.check()
+    assert [c.movement for c in changes if c.table_name == "family"] == ["departure"]
+
+    t = tracked()
+    resp = client.post("/families/bulk", data={"action": "delete", "fid": [str(ids[0]), str(ids[2])], "confirm": "yes"})
+    assert resp.status_code == 302
+    t.check()
+
+
+def test_csv_import_reserves_ids(app, client, tracked):
+    gone = new_family(app, client, "Supprimee", "25", [("Z", "1990-01-01", "F")])
+    gone_person = person_ids(app, gone)[0]
+    assert client.post(f"/families/{gone}/delete").status_code == 302
+
+    t = tracked()
+    csv_text = (
+        "last_name,first_name,family_label,room_number,arrival_date,dob,sex\n"
+        "Import,Ana,Import,26,2024-05-01,1991-01-01,F\n"
+        "Import,Bo,Import,26,,2019-07-07,M\n"
+        "Autre,Cy,Autre,27,2024-05-02,,\n"
+    )
+    resp = client.post("/import", data={"file": (BytesIO(csv_text.encode()), "import.csv"), "mode": "import"},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 302
+    changes = t.check()
+    new_ids = {(c.table_name, c.row_id) for c in changes}
+    assert min(i for table, i in new_ids if table == "family") > gone
+    assert min(i for table, i in new_ids if table == "person") > gone_person
+    assert sorted(c.movement for c in changes if c.table_name == "family") == ["arrival", "arrival"]
+
+
+def test_json_restore(app, client, tracked):
+    new_family(app, client, "Sauvee", "30", [("S", "1960-01-01", "M")])
+    backup = client.get("/backup").data
+    t = tracked()
+    resp = client.post("/restore", data={"confirm": "yes", "file": (BytesIO(backup), "backup.json")},
+                       content_type="multipart/form-data")
+    assert resp.status_code == 302
+    t.check()
+
+
+def test_archive_and_unarchive(app, client, tracked):
+    fid = new_family(app, client, "Archivee", "31", [("A", "1950-01-01", "F")])
+    assert client.post(f"/families/{fid}/depart", data={"departure_date": "2020-01-01"}).status_code == 302
+
+    t = tracked()
+    assert app.archive_departed(date(2026, 10, 19)) >= 1
+    changes = t.check()
+    assert [c.op for c in changes if c.table_name == "family" and c.row_id == fid] == ["archive"]
+    archived = set(app.db.session.execute(
+        text("SELECT table_name, row_id FROM backup_pending WHERE table_name LIKE 'archived_%'")
+    ).all())
+    assert ("archived_family", fid) in archived
+
+    t = tracked()
+    assert client.post(f"/families/{fid}/depart", data={"departure_date": ""}).status_code == 302
+    changes = t.check()
+    # Recopiée telle qu'archivée (partie), puis retour
+    assert [c.movement for c in changes if c.table_name == "family"] == [None, "return"]
+
+
+def test_duplicate_merge(app, client, tracked):
+    a = new_family(app, client, "Doublon A", "33", [("Jean", "1970-01-01", "M"), ("Lea", "1999-01-01", "F")])
+    b = new_family(app, client, "Doublon B", "34", [("Jean", "", "Autre/NP")])
+    keep, drop = person_ids(app, a)[0], person_ids(app, b)[0]
+
+    t = tracked()
+    lo, hi = sorted((keep, drop))
+    assert client.post("/duplicates/resolve", data={"a": lo, "b": hi, "keep": keep}).status_code == 302
+    t.check()
+    assert app.db.session.get(app.Family, b) is None